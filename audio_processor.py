@@ -1,74 +1,807 @@
 import numpy as np
 import soundfile as sf
+import glob
 import logging
 from datetime import datetime
 import os
-import matchering as mg
+from audio_stats import StatsAccumulator, compute_stats, to_db
+from export import StreamingExporter
+from result_cache import DEFAULT_MAX_MB, ResultCache, hash_file, result_key
+from overview import build_overview, load_overview, overview_key, save_overview
+from timing import StageTimer, stage, write_timing
+
+# matchering, scipy y statsmodels tardan varios segundos en importarse: se
+# cargan la primera vez que se necesitan (o antes, con warm_up())
+
+# Extensiones que se buscan al cargar una carpeta
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.flac', '.aiff', '.aif', '.ogg')
+
+# Duración del tramo que se previsualiza si no se elige uno
+PREVIEW_SECONDS = 30
+
+
+def find_audio_files(sources):
+    """Expande rutas, carpetas y patrones glob a una lista de archivos.
+    
+    De las carpetas se toman los archivos de audio (sin recursión); los
+    patrones se expanden aquí porque la shell de Windows no lo hace. Se
+    eliminan los duplicados manteniendo el orden.
+    """
+    if isinstance(sources, str):
+        sources = [sources]
+    
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            files.extend(sorted(
+                os.path.join(source, name) for name in os.listdir(source)
+                if name.lower().endswith(AUDIO_EXTENSIONS)
+                and os.path.isfile(os.path.join(source, name))
+            ))
+        else:
+            matches = sorted(match for match in glob.glob(source) if not os.path.isdir(match))
+            files.extend(matches if matches else [source])
+    return list(dict.fromkeys(files))
 
 class AudioProcessor:
     def __init__(self):
         self.logger = logging.getLogger('MasterW')
         self.target_audio = None
         self.target_sr = None
+        self.target_overview = None
+        self.target_hash = None
         self.reference_audio = None
         self.reference_sr = None
+        self.reference_hash = None
+        self.reference_profile = None
+        self.reference_overview = None
+        self.match_target = None
+        self.match_plan = None
         self.result_audio = None
         self.result_sr = None
+        self.result_overview = None
+        self.result_preview = None  # Tramo (inicio, fin) en segundos si el resultado es una previsualización
+        self.audio_stats = {}  # Estadísticas de cada pista, calculadas una sola vez
+        self.audio_loudness = {}  # Medidas EBU R128 de cada pista, bajo demanda
+        self.audio_paths = {}  # Archivo de origen de cada pista cargada
+        self.load_timings = {}  # Etapas de carga pendientes de incluir en un trabajo
+        self.last_timing = None  # Registro de tiempos del último trabajo
         
         # Configuraciones de Matchering
         self.results_folder = "resultados"
         self.sample_rate = 44100  # Sample rate objetivo
+        self.export_native_rate = True  # Exportar al sample rate original del objetivo
+        self.in_memory = True  # Procesar sin archivos temporales en disco
+        self._mg_config = None  # Configuración de matchering, creada al usarse
+        self.build_overviews = True  # Resúmenes de visualización al cargar
+        self.use_memmap = False  # Respaldar las pistas en disco (sesiones muy largas)
+        self.backing_files = {}
+        
+        # Resúmenes de visualización (.peaks) de los archivos abiertos (None para no guardarlos)
+        self.overviews_folder = os.path.join(self.results_folder, "resumenes")
+        
+        # Perfiles de referencia analizados, junto a la carpeta de resultados
+        self.profiles_folder = "perfiles"
+        
+        # Caché de resultados por contenido (None para desactivarla)
+        self.result_cache_folder = os.path.join(self.results_folder, "cache")
+        self.result_cache_max_mb = DEFAULT_MAX_MB
+        
+        # Índice de la biblioteca de referencias para sugerir referencias (None para no usarlo)
+        self.library_index = os.path.join(self.results_folder, "biblioteca_referencias.npz")
+        self._library = None
+        self._library_stamp = None
+        
+        # Registros de tiempos por trabajo (None para no guardarlos; main.py --timing
+        # los guarda en resultados/tiempos)
+        self.timing_folder = None
+        self.trace_memory = False  # Memoria pico por etapa (ralentiza el análisis)
+        
+        # Asegurar que existen los directorios de resultados y perfiles
+        for folder in [self.results_folder, self.profiles_folder]:
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+
+    @property
+    def mg_config(self):
+        """Configuración de matchering (importa matchering la primera vez)."""
+        if self._mg_config is None:
+            import matchering as mg
+            self._mg_config = mg.Config()
+        return self._mg_config
+
+    @mg_config.setter
+    def mg_config(self, config):
+        self._mg_config = config
+
+    def warm_up(self, timer=None):
+        """Importa por adelantado los módulos pesados de la masterización.
         
-        # Asegurar que existe el directorio de resultados
-        if not os.path.exists(self.results_folder):
-            os.makedirs(self.results_folder)
+        Pensado para ejecutarse en un hilo en segundo plano al arrancar, de
+        modo que la primera carga o masterización no pague la importación.
+        """
+        with stage(timer, 'import_scipy'):
+            import loudness
+        with stage(timer, 'import_matchering'):
+            import mastering
 
-    def load_target(self, file_path):
-        """Carga el archivo de audio objetivo."""
+    def load_target(self, file_path, overview_callback=None):
+        """Carga el archivo de audio objetivo.
+        
+        Si el archivo ya tiene resumen guardado, se usa sin recalcularlo y se
+        avisa a 'overview_callback' (con el tipo de pista) antes de decodificar.
+        """
+        timer = StageTimer(trace_memory=self.trace_memory).start()
+        previous_overview = self.target_overview
         try:
-            self.target_audio, self.target_sr = sf.read(file_path)
+            # Descartar el plan de matching del objetivo anterior
+            self.match_target = None
+            self.match_plan = None
+            
+            overview = self._saved_overview(file_path, 'target', timer, overview_callback)
+            with timer.stage('load_target'):
+                self.target_audio, self.target_sr, stats = self._read_audio(file_path, 'target')
+            self.audio_stats['target'] = stats
+            self.audio_loudness.pop('target', None)
+            self.audio_paths['target'] = file_path
             
-            # Convertir a float32 si es necesario
-            if self.target_audio.dtype != np.float32:
-                self.target_audio = self.target_audio.astype(np.float32)
+            if overview is None:
+                with timer.stage('overview_target'):
+                    self.target_overview = self._build_overview(self.target_audio, self.target_sr)
+                self._save_overview(file_path, self.target_overview)
             
-            # Normalizar si es necesario
-            max_val = np.max(np.abs(self.target_audio))
-            if max_val > 1.0:
-                self.target_audio = self.target_audio / max_val
+            # Solo hace falta para reconocer resultados ya calculados
+            self.target_hash = None
+            if self.result_cache_folder:
+                with timer.stage('hash_target'):
+                    self.target_hash = hash_file(file_path)
+            self.load_timings['target'] = timer.stage_records()
                 
             self.logger.info(f"Audio objetivo cargado: {os.path.basename(file_path)}")
             return True
         except Exception as e:
             self.logger.error(f"Error al cargar audio objetivo: {str(e)}")
+            self.target_overview = previous_overview
             return False
+        finally:
+            timer.stop()
 
-    def load_reference(self, file_path):
-        """Carga el archivo de audio de referencia."""
+    def load_reference(self, file_path, overview_callback=None):
+        """Carga el archivo de audio de referencia (ver load_target)."""
+        timer = StageTimer(trace_memory=self.trace_memory).start()
+        previous_overview = self.reference_overview
         try:
-            self.reference_audio, self.reference_sr = sf.read(file_path)
+            overview = self._saved_overview(file_path, 'reference', timer, overview_callback)
+            with timer.stage('load_reference'):
+                self.reference_audio, self.reference_sr, stats = self._read_audio(file_path, 'reference')
+            self.audio_stats['reference'] = stats
+            self.audio_loudness.pop('reference', None)
+            self.audio_paths['reference'] = file_path
             
-            # Convertir a float32 si es necesario
-            if self.reference_audio.dtype != np.float32:
-                self.reference_audio = self.reference_audio.astype(np.float32)
+            if overview is None:
+                with timer.stage('overview_reference'):
+                    self.reference_overview = self._build_overview(self.reference_audio, self.reference_sr)
+                self._save_overview(file_path, self.reference_overview)
             
-            # Normalizar si es necesario
-            max_val = np.max(np.abs(self.reference_audio))
-            if max_val > 1.0:
-                self.reference_audio = self.reference_audio / max_val
+            # El perfil se calculará (o leerá de caché) al masterizar
+            with timer.stage('hash_reference'):
+                self.reference_hash = hash_file(file_path)
+            self.reference_profile = None
+            self.load_timings['reference'] = timer.stage_records()
             
             self.logger.info(f"Audio de referencia cargado: {os.path.basename(file_path)}")
             return True
         except Exception as e:
             self.logger.error(f"Error al cargar audio de referencia: {str(e)}")
+            self.reference_overview = previous_overview
+            return False
+        finally:
+            timer.stop()
+
+    def _read_audio(self, file_path, audio_type, block_size=65536):
+        """Lee un archivo por bloques directamente en un buffer float32.
+        
+        Calcula las estadísticas de la pista en la misma pasada y normaliza en
+        el sitio, de modo que nunca coexisten copias completas en float64 y
+        float32. Con use_memmap el buffer de la pista 'audio_type' es un
+        np.memmap en la carpeta de resultados.
+        Devuelve (audio, sample_rate, estadísticas).
+        """
+        audio = None
+        try:
+            with sf.SoundFile(file_path) as f:
+                sample_rate = f.samplerate
+                stats = StatsAccumulator(f.channels)
+                
+                if f.frames > 0:
+                    shape = (f.frames, f.channels) if f.channels > 1 else (f.frames,)
+                    audio = self._allocate_audio(shape, audio_type)
+                    position = 0
+                    while position < f.frames:
+                        block = audio[position:position + block_size]
+                        read = f.read(len(block), dtype='float32', out=block)
+                        if len(read) == 0:
+                            break
+                        stats.update(block[:len(read)])
+                        position += len(read)
+                    audio = audio[:position]
+                else:
+                    # Formatos sin longitud conocida: acumular los bloques
+                    blocks = []
+                    for block in f.blocks(blocksize=block_size, dtype='float32'):
+                        stats.update(block)
+                        blocks.append(block)
+                    audio = np.concatenate(blocks) if blocks else np.empty(0, dtype=np.float32)
+                    audio = self._store_audio(audio, audio_type)
+            
+            if audio.size == 0:
+                raise ValueError("El archivo no contiene audio")
+            
+            # Normalizar si es necesario, recontando las muestras recortadas
+            # en la misma pasada
+            peak = stats.result()['peak']
+            if peak > 1.0:
+                stats.scale(1.0 / peak)
+                for start in range(0, len(audio), block_size):
+                    block = audio[start:start + block_size]
+                    block /= peak
+                    stats.count_clipped(block)
+            
+            if isinstance(audio, np.memmap):
+                audio.flush()
+        except BaseException:
+            # La pista anterior sigue cargada: solo sobra el buffer nuevo
+            backing_path = getattr(audio, 'filename', None)
+            audio = block = None
+            self._remove_backing(backing_path)
+            raise
+        
+        self._commit_audio(audio, audio_type)
+        return audio, sample_rate, stats.result()
+
+    def _allocate_audio(self, shape, audio_type):
+        """Reserva un buffer float32 nuevo, en memoria o respaldado en disco.
+        
+        El archivo de respaldo no sustituye al de la pista hasta _commit_audio,
+        así que si falla el llenado la pista anterior sigue intacta.
+        """
+        if not self.use_memmap:
+            return np.empty(shape, dtype=np.float32)
+        
+        return np.memmap(self.backing_path(audio_type), dtype=np.float32, mode='w+', shape=shape)
+
+    def _commit_audio(self, audio, audio_type):
+        """Hace del buffer ya lleno el de la pista y libera el respaldo anterior."""
+        backing_path = getattr(audio, 'filename', None)
+        if backing_path is not None and backing_path == self.backing_files.get(audio_type):
+            return
+        self._release_backing(audio_type)
+        if backing_path is not None:
+            self.backing_files[audio_type] = backing_path
+
+    def backing_path(self, audio_type):
+        """Ruta nueva para un archivo de respaldo de la pista (no se reserva)."""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        return os.path.join(self.results_folder, f"cache_{audio_type}_{timestamp}.f32")
+
+    def _store_audio(self, audio, audio_type):
+        """Copia un array ya calculado a un buffer nuevo de la pista (ver _allocate_audio)."""
+        if not self.use_memmap:
+            return audio
+        
+        buffer = self._allocate_audio(audio.shape, audio_type)
+        buffer[:] = audio
+        buffer.flush()
+        return buffer
+
+    def _release_backing(self, audio_type):
+        """Libera el archivo de respaldo de una pista, si lo tiene."""
+        backing_path = self.backing_files.pop(audio_type, None)
+        if backing_path is None:
+            return
+        
+        # Soltar el mapeo antes de borrar (necesario en Windows)
+        setattr(self, f'{audio_type}_audio', None)
+        self._remove_backing(backing_path)
+
+    def _remove_backing(self, backing_path):
+        """Borra un archivo de respaldo ya sin mapear."""
+        if backing_path is None:
+            return
+        try:
+            os.remove(backing_path)
+        except OSError as e:
+            self.logger.warning(f"No se pudo eliminar archivo de respaldo {backing_path}: {str(e)}")
+
+    def cleanup(self, audio_types=None):
+        """Elimina los archivos de respaldo de las pistas indicadas (o de todas)."""
+        for audio_type in list(audio_types or self.backing_files):
+            self._release_backing(audio_type)
+
+    def process_audio(self, progress_callback=None, destination=None):
+        """Procesa el audio usando matchering.
+        
+        Si se indica 'destination' (una ruta o varios destinos con su
+        formato), el resultado también se escribe ahí a medida que se genera.
+        """
+        if self.target_audio is None or self.reference_audio is None:
+            self.logger.error("Se necesitan tanto el audio objetivo como el de referencia")
             return False
 
-    def process_audio(self, progress_callback=None):
-        """Procesa el audio usando matchering."""
+        self.result_preview = None
+        timer = self.start_timing('in_memory' if self.in_memory else 'files')
+        with timer.stage('cache_lookup'):
+            cached = self.load_cached_result()
+        timer.job['cached'] = cached
+        
+        if cached:
+            success = True
+            if destination:
+                with timer.stage('encode'):
+                    success = self.save_result(destination)
+            if progress_callback:
+                progress_callback(100)
+        else:
+            if self.in_memory:
+                success = self._process_in_memory(progress_callback, destination, timer)
+            else:
+                success = self._process_with_files(progress_callback, timer)
+                if success and destination:
+                    with timer.stage('encode'):
+                        success = self.save_result(destination)
+            if success:
+                with timer.stage('cache_store'):
+                    self.store_cached_result()
+        self.finish_timing(timer.stop(success))
+        return success
+
+    def loudest_region(self, seconds=PREVIEW_SECONDS, block_size=4096):
+        """Tramo (inicio, fin) en muestras de mayor energía del objetivo.
+        
+        Usa los niveles del resumen de visualización si ya existen; si no,
+        mide la energía por bloques sobre el audio.
+        """
+        length = len(self.target_audio)
+        span = int(seconds * self.target_sr)
+        if span >= length:
+            return 0, length
+        
+        overview = self.target_overview
+        if overview is not None and overview.length == length:
+            level = overview.levels[0]
+            block_size = level.block_size
+            energy = np.asarray(level.sumsq, dtype=np.float64)
+        else:
+            energy = np.empty(-(-length // block_size))
+            chunk_size = 256 * block_size
+            for start in range(0, length, chunk_size):
+                # Mezcla mono, igual que en el resumen
+                chunk = self.target_audio[start:start + chunk_size]
+                chunk = np.square(chunk.mean(axis=1, dtype=np.float64) if chunk.ndim > 1 else chunk, dtype=np.float64)
+                edges = np.arange(0, len(chunk), block_size)
+                energy[start // block_size:start // block_size + len(edges)] = np.add.reduceat(chunk, edges)
+        
+        # Suma deslizante de la energía sobre ventanas de 'span' muestras
+        window = max(span // block_size, 1)
+        cumulative = np.concatenate([[0.0], np.cumsum(energy)])
+        start = int(np.argmax(cumulative[window:] - cumulative[:-window])) * block_size
+        return start, min(start + span, length)
+
+    def process_preview(self, region=None, progress_callback=None):
+        """Masteriza solo un tramo del objetivo para escuchar el resultado rápido.
+        
+        'region' es (inicio, fin) en segundos; sin ella se usa el tramo más
+        fuerte de PREVIEW_SECONDS. El análisis de la referencia se reutiliza
+        si ya está en caché (y el calculado aquí sirve luego para la pista
+        completa). El resultado ocupa el lugar del resultado normal, con
+        result_preview indicando el tramo; no se guarda en la caché.
+        """
         if self.target_audio is None or self.reference_audio is None:
             self.logger.error("Se necesitan tanto el audio objetivo como el de referencia")
             return False
 
+        timer = self.start_timing('preview')
+        success = False
+        try:
+            if progress_callback:
+                progress_callback(0)
+            
+            with timer.stage('preview_region'):
+                start, end = self.preview_bounds(region)
+            
+            import matchering as mg
+            mg.log(self.logger.info)
+            
+            self.analyze_match(
+                lambda fraction: progress_callback(40 * fraction) if progress_callback else None,
+                timer,
+                region=(start, end)
+            )
+            self.apply_match(
+                progress_callback=lambda fraction: progress_callback(40 + 55 * fraction) if progress_callback else None,
+                timer=timer
+            )
+            
+            with timer.stage('overview'):
+                self.result_overview = self._build_overview(self.result_audio, self.result_sr)
+            self.mark_preview(start, end)
+            self.logger.info("Previsualización completada")
+            
+            if progress_callback:
+                progress_callback(100)
+            success = True
+        except Exception as e:
+            self.logger.error(f"Error en la previsualización: {str(e)}")
+            self._release_backing('result')
+            self.result_audio = None
+            self.result_sr = None
+            self.result_overview = None
+            self.result_preview = None
+        finally:
+            # El plan del tramo no sirve para la pista completa
+            self.match_target = None
+            self.match_plan = None
+        self.finish_timing(timer.stop(success))
+        return success
+
+    def preview_bounds(self, region=None):
+        """Tramo (inicio, fin) en muestras a previsualizar.
+        
+        'region' es (inicio, fin) en segundos; sin ella se usa el tramo más
+        fuerte de PREVIEW_SECONDS.
+        """
+        if region is None:
+            start, end = self.loudest_region()
+        else:
+            start = max(0, int(region[0] * self.target_sr))
+            end = min(len(self.target_audio), int(region[1] * self.target_sr))
+        self.logger.info(
+            f"Previsualizando de {start / self.target_sr:.1f} s a {end / self.target_sr:.1f} s..."
+        )
+        return start, end
+
+    def mark_preview(self, start, end):
+        """Marca el resultado actual como previsualización del tramo [start, end) en muestras."""
+        offset = start / self.target_sr
+        if self.result_overview is not None:
+            self.result_overview.offset = offset
+        self.result_preview = (offset, end / self.target_sr)
+
+    def _result_cache(self):
+        """Caché de resultados, o None si está desactivada."""
+        if not self.result_cache_folder:
+            return None
+        return ResultCache(self.result_cache_folder, self.result_cache_max_mb)
+
+    def result_key(self):
+        """Clave del resultado de las pistas cargadas, o None sin caché o sin hashes."""
+        if not self.result_cache_folder or not self.target_hash or not self.reference_hash:
+            return None
+        return result_key(
+            self.target_hash,
+            self.reference_hash,
+            self.mg_config,
+            'in_memory' if self.in_memory else 'files'
+        )
+
+    def load_cached_result(self):
+        """Adopta el resultado guardado para las pistas y la configuración actuales.
+        
+        Devuelve True si había uno en la caché.
+        """
+        key = self.result_key()
+        if key is None:
+            return False
+        
+        try:
+            entry = self._result_cache().get(key)
+            if entry is None:
+                return False
+            audio, meta = entry
+            self.adopt_result(audio, meta['sample_rate'], meta['stats'], meta['loudness'])
+            del audio
+        except Exception as e:
+            self.logger.warning(f"No se pudo leer el resultado en caché: {str(e)}")
+            return False
+        
+        self.logger.info("Usando resultado en caché")
+        return True
+
+    def store_cached_result(self):
+        """Guarda el resultado actual en la caché, con lo ya calculado de él."""
+        key = self.result_key()
+        if key is None or self.result_audio is None:
+            return False
+        
+        try:
+            return self._result_cache().put(
+                key,
+                self.result_audio,
+                self.result_sr,
+                self.audio_stats.get('result'),
+                self.audio_loudness.get('result')
+            )
+        except Exception as e:
+            self.logger.warning(f"No se pudo guardar el resultado en caché: {str(e)}")
+            return False
+
+    def start_timing(self, mode):
+        """Empieza el registro de tiempos de un trabajo de masterización.
+        
+        Incluye las etapas de carga de las pistas cargadas desde el trabajo anterior.
+        """
+        job = {'mode': mode}
+        for audio_type in ['target', 'reference']:
+            if audio_type in self.audio_paths:
+                job[audio_type] = os.path.basename(self.audio_paths[audio_type])
+        if self.target_audio is not None and self.target_sr:
+            job['duration'] = round(len(self.target_audio) / self.target_sr, 3)
+            job['sample_rate'] = self.target_sr
+
+        timer = StageTimer(job, trace_memory=self.trace_memory).start()
+        for audio_type in ['reference', 'target']:
+            timer.add_stages(self.load_timings.pop(audio_type, []))
+        return timer
+
+    def finish_timing(self, record):
+        """Guarda el registro de tiempos del trabajo terminado."""
+        self.last_timing = record
+        if not self.timing_folder:
+            return
+        try:
+            timing_path = write_timing(record, self.timing_folder)
+            self.logger.info(f"Registro de tiempos guardado en: {timing_path}")
+        except Exception as e:
+            self.logger.warning(f"No se pudo guardar el registro de tiempos: {str(e)}")
+
+    def _process_in_memory(self, progress_callback=None, destination=None, timer=None):
+        """Procesa el audio pasando los arrays cargados directamente a matchering."""
+        try:
+            if progress_callback:
+                progress_callback(0)
+
+            self.logger.info("Iniciando proceso de masterización en memoria...")
+
+            # Configurar el logging de matchering
+            import matchering as mg
+            mg.log(self.logger.info)
+
+            self.analyze_match(
+                lambda fraction: progress_callback(30 * fraction) if progress_callback else None,
+                timer
+            )
+
+            self.apply_match(
+                destination,
+                lambda fraction: progress_callback(30 + 65 * fraction) if progress_callback else None,
+                timer=timer
+            )
+
+            with stage(timer, 'overview'):
+                self.result_overview = self._build_overview(self.result_audio, self.result_sr)
+            self.logger.info("Masterización completada exitosamente")
+
+            if progress_callback:
+                progress_callback(100)
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Error en el proceso de masterización: {str(e)}")
+            self._release_backing('result')
+            self.result_audio = None
+            self.result_sr = None
+            self.result_overview = None
+            return False
+
+    def analyze_match(self, progress_callback=None, timer=None, region=None):
+        """Fase de análisis: calcula el filtro de matching y la ganancia del objetivo.
+        
+        'progress_callback' recibe la fracción completada del análisis. Con
+        'region' (inicio, fin) en muestras, solo se analiza ese tramo.
+        """
+        def report(fraction):
+            if progress_callback:
+                progress_callback(fraction)
+
+        from mastering import analyze_target, check_equality, prepare_target, resample_to_internal, to_2d
+
+        with stage(timer, 'reference_analysis'):
+            if not self.mg_config.allow_equality:
+                check_equality(to_2d(self.target_audio), to_2d(self.reference_audio))
+            profile = self.get_reference_profile()
+        report(0.2)
+
+        target, target_sr = self.target_audio, self.target_sr
+        if region is not None:
+            target = target[region[0]:region[1]]
+        if target_sr != self.mg_config.internal_sample_rate:
+            with stage(timer, 'resample'):
+                target = resample_to_internal(target, target_sr, self.mg_config, "target")
+                target_sr = self.mg_config.internal_sample_rate
+
+        with stage(timer, 'target_preparation'):
+            self.match_target = prepare_target(target, target_sr, self.mg_config)
+        report(0.3)
+
+        with stage(timer, 'target_analysis'):
+            self.match_plan = analyze_target(
+                self.match_target,
+                profile,
+                self.mg_config,
+                lambda fraction: report(0.3 + 0.7 * fraction)
+            )
+        return self.match_plan
+
+    def apply_match(self, destination=None, progress_callback=None, out=None, timer=None):
+        """Fase de aplicación: procesa el objetivo por bloques con el plan calculado.
+        
+        Cada bloque se copia al resultado (o al buffer 'out', si se indica)
+        y, si se indica, se escribe en 'destination' en cuanto está listo:
+        todos sus archivos y formatos a la vez, sin pasar por un archivo
+        intermedio.
+        """
+        if self.match_plan is None:
+            raise Exception("Debe ejecutarse el análisis antes de aplicar el matching")
+        from mastering import apply_match
+
+        length = len(self.match_target)
+        result_sr = self.mg_config.internal_sample_rate
+        result = out if out is not None else self._allocate_audio((length, 2), 'result')
+        exporter = None
+        if destination:
+            exporter = StreamingExporter(
+                destination, self.export_sample_rate(result_sr), channels=2, source_rate=result_sr
+            )
+
+        try:
+            position = 0
+            blocks = apply_match(self.match_target, self.match_plan, self.mg_config, timer=timer)
+            for block in blocks:
+                result[position:position + len(block)] = block
+                if exporter is not None:
+                    with stage(timer, 'encode'):
+                        exporter.write(block)
+                position += len(block)
+                if progress_callback:
+                    progress_callback(position / length)
+            
+            if exporter is not None:
+                with stage(timer, 'encode'):
+                    exporter.close()
+        except BaseException:
+            if exporter is not None:
+                exporter.abort()
+            if out is None:
+                backing_path = getattr(result, 'filename', None)
+                result = None
+                self._remove_backing(backing_path)
+            raise
+
+        if isinstance(result, np.memmap):
+            result.flush()
+
+        if out is None:
+            self._commit_audio(result, 'result')
+        self.result_audio = result
+        self.result_sr = result_sr
+        self.audio_stats.pop('result', None)
+        self.audio_loudness.pop('result', None)
+        if exporter is not None:
+            for path in exporter.paths:
+                self.logger.info(f"Resultado guardado en: {path}")
+        return result
+
+    def adopt_result(self, audio, sample_rate, stats=None, loudness=None, overview=None, backing_path=None):
+        """Copia un resultado calculado en otro proceso al almacenamiento de la pista.
+        
+        Las estadísticas, la loudness y el resumen ya calculados se reutilizan.
+        Si el resultado ya está en un archivo de respaldo ('backing_path', con
+        'audio' mapeado sobre él), se adopta ese archivo sin copiarlo.
+        """
+        if backing_path is not None:
+            self._release_backing('result')
+            self.backing_files['result'] = backing_path
+            result = audio
+        else:
+            result = self._allocate_audio(audio.shape, 'result')
+            result[:] = audio
+            if isinstance(result, np.memmap):
+                result.flush()
+            self._commit_audio(result, 'result')
+
+        self.result_audio = result
+        self.result_sr = sample_rate
+        self.result_preview = None
+        self.audio_stats.pop('result', None)
+        self.audio_loudness.pop('result', None)
+        if stats is not None:
+            self.audio_stats['result'] = stats
+        if loudness is not None:
+            self.audio_loudness['result'] = loudness
+        self.result_overview = overview if overview is not None else self._build_overview(result, sample_rate)
+        return result
+
+    def _overview_path(self, file_path):
+        return os.path.join(self.overviews_folder, f"{overview_key(file_path)}.peaks")
+
+    def _saved_overview(self, file_path, audio_type, timer=None, overview_callback=None):
+        """Usa el resumen guardado de un archivo, si existe y sigue vigente.
+        
+        Devuelve el resumen (ya asignado a la pista) o None.
+        """
+        if not (self.overviews_folder and self.build_overviews and os.path.isfile(file_path)):
+            return None
+        try:
+            with stage(timer, f'overview_{audio_type}_saved'):
+                overview_path = self._overview_path(file_path)
+                if not os.path.exists(overview_path):
+                    return None
+                overview = load_overview(overview_path)
+        except Exception as e:
+            self.logger.warning(f"No se pudo leer el resumen guardado: {str(e)}")
+            return None
+
+        setattr(self, f'{audio_type}_overview', overview)
+        if overview_callback:
+            overview_callback(audio_type)
+        return overview
+
+    def _save_overview(self, file_path, overview):
+        """Guarda el resumen de un archivo para mostrarlo al instante la próxima vez."""
+        if not self.overviews_folder or overview is None:
+            return
+        try:
+            os.makedirs(self.overviews_folder, exist_ok=True)
+            save_overview(self._overview_path(file_path), overview)
+        except Exception as e:
+            self.logger.warning(f"No se pudo guardar el resumen: {str(e)}")
+
+    def _build_overview(self, audio, sample_rate):
+        """Calcula el resumen de visualización de una pista."""
+        if not self.build_overviews:
+            return None
+        try:
+            return build_overview(audio, sample_rate)
+        except Exception as e:
+            self.logger.warning(f"No se pudo calcular el resumen de visualización: {str(e)}")
+            return None
+
+    def get_reference_profile(self):
+        """Obtiene el perfil de la referencia, analizándola solo si no está en caché."""
+        if self.reference_profile is not None:
+            return self.reference_profile
+        from mastering import analyze_reference, load_profile, profile_key, save_profile
+
+        profile_path = None
+        if self.reference_hash:
+            key = profile_key(self.reference_hash, self.mg_config)
+            profile_path = os.path.join(self.profiles_folder, f"{key}.npz")
+
+            if os.path.exists(profile_path):
+                try:
+                    self.reference_profile = load_profile(profile_path)
+                    self.logger.info("Usando análisis de referencia en caché")
+                    return self.reference_profile
+                except Exception as e:
+                    self.logger.warning(f"No se pudo leer el perfil en caché: {str(e)}")
+
+        self.logger.info("Analizando audio de referencia...")
+        self.reference_profile = analyze_reference(
+            self.reference_audio,
+            self.reference_sr,
+            self.mg_config
+        )
+
+        if profile_path:
+            try:
+                save_profile(profile_path, self.reference_profile)
+            except Exception as e:
+                self.logger.warning(f"No se pudo guardar el perfil de referencia: {str(e)}")
+
+        return self.reference_profile
+
+    def _process_with_files(self, progress_callback=None, timer=None):
+        """Procesa el audio con matchering a través de archivos temporales."""
         try:
             # Crear nombres de archivo temporales
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -81,9 +814,19 @@ class AudioProcessor:
                 if progress_callback:
                     progress_callback(10)
                 
+                # Remuestrear aquí: matchering usaría resampy, mucho más lento
+                from mastering import resample_to_internal
+                internal_sr = self.mg_config.internal_sample_rate
+                with stage(timer, 'resample'):
+                    target = resample_to_internal(self.target_audio, self.target_sr, self.mg_config, "target")
+                    reference = resample_to_internal(
+                        self.reference_audio, self.reference_sr, self.mg_config, "reference"
+                    )
+
                 # Guardar como WAV de 32 bits float
-                sf.write(temp_target, self.target_audio, self.target_sr, subtype='FLOAT')
-                sf.write(temp_reference, self.reference_audio, self.reference_sr, subtype='FLOAT')
+                with stage(timer, 'temp_write'):
+                    sf.write(temp_target, target, internal_sr, subtype='FLOAT')
+                    sf.write(temp_reference, reference, internal_sr, subtype='FLOAT')
 
                 if progress_callback:
                     progress_callback(30)
@@ -93,16 +836,18 @@ class AudioProcessor:
                 self.logger.info(f"Usando referencia: {temp_reference}")
                 
                 # Configurar el logging de matchering
+                import matchering as mg
                 mg.log(self.logger.info)
                 
-                # Procesar usando matchering 2.0
-                mg.process(
-                    target=temp_target,
-                    reference=temp_reference,
-                    results=[
-                        mg.pcm24(result_path)
-                    ]
-                )
+                # Procesar usando matchering 2.0 (una sola etapa opaca)
+                with stage(timer, 'matchering'):
+                    mg.process(
+                        target=temp_target,
+                        reference=temp_reference,
+                        results=[
+                            mg.pcm24(result_path)
+                        ]
+                    )
                 
                 if progress_callback:
                     progress_callback(90)
@@ -110,10 +855,17 @@ class AudioProcessor:
                 # Verificar y cargar resultado
                 if os.path.exists(result_path):
                     # Cargar el resultado y verificar que sea válido
-                    result_data, result_sr = sf.read(result_path)
+                    with stage(timer, 'reload'):
+                        result_data, result_sr = sf.read(result_path)
                     if result_data is not None and isinstance(result_data, np.ndarray) and result_data.size > 0:
-                        self.result_audio = result_data
+                        result_audio = self._store_audio(result_data, 'result')
+                        self._commit_audio(result_audio, 'result')
+                        self.result_audio = result_audio
                         self.result_sr = result_sr
+                        self.audio_stats.pop('result', None)
+                        self.audio_loudness.pop('result', None)
+                        with stage(timer, 'overview'):
+                            self.result_overview = self._build_overview(self.result_audio, result_sr)
                         self.logger.info("Masterización completada exitosamente")
                         
                         if progress_callback:
@@ -131,8 +883,10 @@ class AudioProcessor:
         except Exception as e:
             self.logger.error(f"Error en el proceso de masterización: {str(e)}")
             # Limpiar resultado en caso de error
+            self._release_backing('result')
             self.result_audio = None
             self.result_sr = None
+            self.result_overview = None
             return False
 
         finally:
@@ -144,61 +898,151 @@ class AudioProcessor:
                     except Exception as e:
                         self.logger.warning(f"No se pudo eliminar archivo temporal {temp_file}: {str(e)}")
             
-            # Si hubo error, intentar limpiar el resultado temporal
-            if not hasattr(self, 'result_audio') or self.result_audio is None:
-                if os.path.exists(result_path):
-                    try:
-                        os.remove(result_path)
-                    except Exception as e:
-                        self.logger.warning(f"No se pudo eliminar archivo resultado {result_path}: {str(e)}")
+            # El resultado ya está en memoria (y en la caché): no dejar copias sueltas
+            if os.path.exists(result_path):
+                try:
+                    os.remove(result_path)
+                except Exception as e:
+                    self.logger.warning(f"No se pudo eliminar archivo resultado {result_path}: {str(e)}")
 
-    def save_result(self, file_path):
-        """Guarda el resultado del procesamiento."""
+    def save_result(self, destinations, block_size=65536):
+        """Guarda el resultado del procesamiento.
+        
+        'destinations' es una ruta o una lista de destinos con su formato
+        (ver export.normalize_destinations); todos se escriben en una sola
+        pasada sobre el resultado.
+        """
         if not hasattr(self, 'result_audio') or self.result_audio is None:
             self.logger.error("No hay resultado para guardar")
             return False
 
         try:
-            sf.write(file_path, self.result_audio, self.result_sr)
-            self.logger.info(f"Resultado guardado en: {file_path}")
+            channels = self.result_audio.shape[1] if self.result_audio.ndim > 1 else 1
+            
+            # Escribir por bloques para no cargar un resultado respaldado en disco
+            export_sr = self.export_sample_rate(self.result_sr)
+            with StreamingExporter(destinations, export_sr, channels, source_rate=self.result_sr) as exporter:
+                for start in range(0, len(self.result_audio), block_size):
+                    exporter.write(self.result_audio[start:start + block_size])
+            for path in exporter.paths:
+                self.logger.info(f"Resultado guardado en: {path}")
             return True
         except Exception as e:
             self.logger.error(f"Error al guardar el resultado: {str(e)}")
             return False
 
-    def get_audio_info(self, audio_type='target'):
-        """Obtiene información del audio (target/reference/result)."""
-        audio_data = None
-        sr = None
+    def export_sample_rate(self, sample_rate):
+        """Sample rate de los archivos exportados.
         
+        matchering trabaja a 44.1 kHz: con export_native_rate, el resultado
+        se devuelve al sample rate del objetivo al exportarlo.
+        """
+        if self.export_native_rate and self.target_sr:
+            return self.target_sr
+        return sample_rate
+
+    def _get_track(self, audio_type):
+        """Devuelve (audio, sample_rate) de la pista indicada."""
         if audio_type == 'target' and hasattr(self, 'target_audio'):
-            audio_data = self.target_audio
-            sr = self.target_sr
+            return self.target_audio, self.target_sr
         elif audio_type == 'reference' and hasattr(self, 'reference_audio'):
-            audio_data = self.reference_audio
-            sr = self.reference_sr
+            return self.reference_audio, self.reference_sr
         elif audio_type == 'result' and hasattr(self, 'result_audio'):
-            audio_data = self.result_audio
-            sr = self.result_sr
+            return self.result_audio, self.result_sr
+        return None, None
+
+    def get_loudness(self, audio_type='target'):
+        """Obtiene las medidas de loudness EBU R128 de una pista.
         
+        Se calculan la primera vez que se piden y se reutilizan hasta que
+        la pista cambia.
+        """
+        loudness = self.audio_loudness.get(audio_type)
+        if loudness is not None:
+            return loudness
+
+        audio_data, sr = self._get_track(audio_type)
         if audio_data is None or not isinstance(audio_data, np.ndarray) or audio_data.size == 0:
             return None
-            
+
+        try:
+            from loudness import measure_loudness
+            measures = measure_loudness(audio_data, sr)
+            loudness = {
+                'integrated': measures['integrated'],
+                'momentary_max': measures['momentary_max'],
+                'short_term_max': measures['short_term_max'],
+                'loudness_range': measures['loudness_range'],
+                'true_peak': measures['true_peak']
+            }
+            self.audio_loudness[audio_type] = loudness
+            return loudness
+        except Exception as e:
+            self.logger.error(f"Error al medir loudness: {str(e)}")
+            return None
+
+    def suggest_references(self, count=None):
+        """Referencias de la biblioteca más parecidas al audio original cargado.
+
+        Devuelve una lista de (ruta, distancia); vacía si no hay índice. El
+        índice se vuelve a leer solo si ha cambiado en disco.
+        """
+        if self.library_index is None or self.target_audio is None:
+            return []
+        if not os.path.exists(self.library_index):
+            return []
+
+        from reference_library import DEFAULT_SUGGESTIONS, ReferenceLibrary
         try:
-            # Calcular RMS y convertirlo a dB
-            rms = np.sqrt(np.mean(audio_data**2))
-            rms_db = 20 * np.log10(rms) if rms > 0 else -100
+            info = os.stat(self.library_index)
+            stamp = (info.st_mtime_ns, info.st_size)
+            if self._library is None or stamp != self._library_stamp:
+                library = ReferenceLibrary(self.library_index)
+                self._library = library if library.load() else None
+                self._library_stamp = stamp
+            if self._library is None:
+                return []
+
+            stats = self.audio_stats.get('target')
+            if stats is None:
+                stats = compute_stats(self.target_audio)
+                self.audio_stats['target'] = stats
+            return self._library.suggest(
+                self.target_audio, self.target_sr, count or DEFAULT_SUGGESTIONS,
+                exclude=self.audio_paths.get('target'), stats=stats
+            )
+        except Exception as e:
+            self.logger.warning(f"No se pudieron sugerir referencias: {str(e)}")
+            return []
+
+    def get_audio_info(self, audio_type='target'):
+        """Obtiene información del audio (target/reference/result)."""
+        audio_data, sr = self._get_track(audio_type)
+        
+        if audio_data is None or not isinstance(audio_data, np.ndarray) or audio_data.size == 0:
+            return None
             
-            # Calcular peak y convertirlo a dB
-            peak = np.max(np.abs(audio_data))
-            peak_db = 20 * np.log10(peak) if peak > 0 else -100
+        try:
+            # Las estadísticas se calculan una vez por pista y se reutilizan
+            stats = self.audio_stats.get(audio_type)
+            if stats is None:
+                stats = compute_stats(audio_data)
+                self.audio_stats[audio_type] = stats
                 
             return {
                 'duration': len(audio_data) / sr,
-                'channels': 2 if len(audio_data.shape) > 1 else 1,
+                'channels': stats['channels'],
                 'sample_rate': sr,
-                'peak': peak_db,
-                'rms': rms_db
+                'peak': to_db(stats['peak']),
+                'rms': to_db(stats['rms']),
+                'crest': to_db(stats['peak']) - to_db(stats['rms']),
+                'clipped': sum(stats['channel_clipped']),
+                'channel_peak': [to_db(v) for v in stats['channel_peak']],
+                'channel_rms': [to_db(v) for v in stats['channel_rms']],
+                'channel_crest': stats['channel_crest'],
+                'channel_dc_offset': stats['channel_dc_offset'],
+                'channel_clipped': stats['channel_clipped'],
+                'loudness': self.get_loudness(audio_type)
             }
         except Exception as e:
             self.logger.error(f"Error al obtener información de audio: {str(e)}")
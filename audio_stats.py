@@ -0,0 +1,93 @@
+import numpy as np
+
+# Nivel a partir del cual una muestra se considera recortada
+CLIP_LEVEL = 0.9999
+
+
+class StatsAccumulator:
+    """Acumula estadísticas por canal bloque a bloque.
+
+    Calcula peak, RMS, factor de cresta, offset DC y número de muestras
+    recortadas sin crear temporales del tamaño de la pista.
+    """
+
+    def __init__(self, channels):
+        self.channels = channels
+        self.maxs = np.full(channels, -np.inf)
+        self.mins = np.full(channels, np.inf)
+        self.sums = np.zeros(channels)
+        self.sum_squares = np.zeros(channels)
+        self.clipped = np.zeros(channels, dtype=np.int64)
+        self.count = 0
+
+    def update(self, block):
+        """Añade un bloque (muestras, canales) o (muestras,) a las estadísticas."""
+        if block.ndim == 1:
+            block = block.reshape(-1, 1)
+        if len(block) == 0:
+            return
+
+        # Reducir canal a canal es mucho más rápido que reducir por el eje 0
+        for channel in range(self.channels):
+            samples = block[:, channel]
+            self.maxs[channel] = max(self.maxs[channel], samples.max())
+            self.mins[channel] = min(self.mins[channel], samples.min())
+            self.sums[channel] += samples.sum(dtype=np.float64)
+            self.sum_squares[channel] += float(np.dot(samples, samples))
+            self._count_clipped(channel, samples)
+        self.count += len(block)
+
+    def _count_clipped(self, channel, samples):
+        self.clipped[channel] += np.count_nonzero(samples >= CLIP_LEVEL)
+        self.clipped[channel] += np.count_nonzero(samples <= -CLIP_LEVEL)
+
+    def scale(self, factor):
+        """Ajusta las estadísticas tras multiplicar el audio por 'factor'.
+
+        Las muestras recortadas no se pueden deducir del factor: el recuento
+        vuelve a cero y hay que rehacerlo con count_clipped sobre el audio
+        ya escalado.
+        """
+        self.maxs *= factor
+        self.mins *= factor
+        self.sums *= factor
+        self.sum_squares *= factor * factor
+        self.clipped[:] = 0
+
+    def count_clipped(self, block):
+        """Cuenta las muestras recortadas de un bloque sin tocar el resto de estadísticas."""
+        if block.ndim == 1:
+            block = block.reshape(-1, 1)
+        for channel in range(self.channels):
+            self._count_clipped(channel, block[:, channel])
+
+    def result(self):
+        """Devuelve las estadísticas por canal y globales."""
+        count = max(self.count, 1)
+        peak = np.maximum(self.maxs, -self.mins) if self.count else np.zeros(self.channels)
+        rms = np.sqrt(self.sum_squares / count)
+
+        return {
+            'channels': self.channels,
+            'peak': float(np.max(peak)),
+            'rms': float(np.sqrt(self.sum_squares.sum() / (count * self.channels))),
+            'channel_peak': peak.tolist(),
+            'channel_rms': rms.tolist(),
+            'channel_crest': [float(to_db(p) - to_db(r)) for p, r in zip(peak, rms)],
+            'channel_dc_offset': (self.sums / count).tolist(),
+            'channel_clipped': self.clipped.tolist(),
+        }
+
+
+def to_db(value):
+    """Convierte una amplitud a dB (con -100 dB como suelo)."""
+    return 20 * np.log10(value) if value > 0 else -100
+
+
+def compute_stats(audio, block_size=65536):
+    """Calcula las estadísticas de una pista en una sola pasada por bloques."""
+    channels = audio.shape[1] if audio.ndim > 1 else 1
+    accumulator = StatsAccumulator(channels)
+    for start in range(0, len(audio), block_size):
+        accumulator.update(audio[start:start + block_size])
+    return accumulator.result()
@@ -0,0 +1,219 @@
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from multiprocessing.util import Finalize
+
+from audio_processor import AudioProcessor, find_audio_files
+from export import DEFAULT_FLAC_LEVEL, DEFAULT_FORMAT, EXPORT_FORMATS, MAX_FLAC_LEVEL
+
+# Procesador de cada proceso del pool, con la referencia ya cargada
+_worker_processor = None
+
+
+def _batch_processor(use_memmap=False, trace_memory=False):
+    """Procesador configurado para trabajar sin interfaz."""
+    processor = AudioProcessor()
+    processor.build_overviews = False  # Sin interfaz no hay nada que dibujar
+    processor.use_memmap = use_memmap
+    # Los tiempos de cada archivo van al resumen del lote
+    processor.timing_folder = None
+    # Cada objetivo se masteriza una vez: la caché solo añadiría hashes, copias y desalojos
+    processor.result_cache_folder = None
+    processor.trace_memory = trace_memory
+    return processor
+
+
+def analyze_reference(reference_path, use_memmap=False):
+    """Analiza la referencia una sola vez para todo el lote (o lee su perfil en caché)."""
+    processor = _batch_processor(use_memmap)
+    try:
+        if not processor.load_reference(reference_path):
+            raise RuntimeError(f"No se pudo cargar la referencia: {reference_path}")
+        return processor.get_reference_profile()
+    finally:
+        processor.cleanup()
+
+
+def _init_worker(reference_path, reference_profile, use_memmap=False, trace_memory=False):
+    """Inicializa un proceso del pool con la referencia ya analizada."""
+    global _worker_processor
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s'
+    )
+    _worker_processor = _batch_processor(use_memmap, trace_memory)
+    # Borrar los archivos de respaldo al terminar el proceso
+    Finalize(_worker_processor, _worker_processor.cleanup, exitpriority=10)
+    if not _worker_processor.load_reference(reference_path):
+        raise RuntimeError(f"No se pudo cargar la referencia: {reference_path}")
+    _worker_processor.reference_profile = reference_profile
+
+
+def output_destinations(target_path, output_dir, formats, flac_level=DEFAULT_FLAC_LEVEL):
+    """Destinos de un archivo: uno por formato, con sufijo si hay varios."""
+    base_name = os.path.splitext(os.path.basename(target_path))[0]
+    destinations = []
+    for name in formats:
+        suffix = f"_{name}" if len(formats) > 1 else ""
+        file_name = f"{base_name}_masterizado{suffix}{EXPORT_FORMATS[name]['extension']}"
+        destinations.append({
+            'path': os.path.join(output_dir, file_name),
+            'format': name,
+            'flac_level': flac_level
+        })
+    return destinations
+
+
+def _master_file(target_path, output_dir, formats=(DEFAULT_FORMAT,), flac_level=DEFAULT_FLAC_LEVEL):
+    """Masteriza un archivo objetivo y devuelve su resumen.
+    
+    Todos los formatos pedidos se escriben a la vez mientras se masteriza.
+    """
+    processor = _worker_processor
+    destinations = output_destinations(target_path, output_dir, formats, flac_level)
+    summary = {
+        'target': target_path,
+        'output': None,
+        'outputs': [],
+        'success': False,
+        'seconds': 0.0,
+        'info': None,
+        'timing': None
+    }
+
+    start = time.perf_counter()
+    try:
+        if not processor.load_target(target_path):
+            summary['error'] = "No se pudo cargar el archivo objetivo"
+        elif not processor.process_audio(destination=destinations):
+            summary['error'] = "Error en el proceso de masterización"
+        else:
+            summary['outputs'] = [destination['path'] for destination in destinations]
+            summary['output'] = summary['outputs'][0]
+            summary['success'] = True
+            summary['info'] = processor.get_audio_info('result')
+    finally:
+        summary['seconds'] = round(time.perf_counter() - start, 3)
+        summary['timing'] = processor.last_timing
+        processor.last_timing = None
+        # Liberar memoria antes del siguiente archivo del mismo proceso
+        processor.match_target = None
+        processor.cleanup(['target', 'result'])
+        processor.target_audio = None
+        processor.result_audio = None
+
+    return summary
+
+
+def run_batch(reference, targets, output_dir, jobs=None, use_memmap=False, trace_memory=False,
+              formats=(DEFAULT_FORMAT,), flac_level=DEFAULT_FLAC_LEVEL):
+    """Masteriza varios archivos contra una misma referencia en paralelo.
+    
+    La referencia se analiza una sola vez, aquí, y su perfil se pasa a los
+    procesos del pool.
+    """
+    logger = logging.getLogger('MasterW')
+    jobs = jobs or os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(targets)))
+    os.makedirs(output_dir, exist_ok=True)
+
+    started = datetime.now()
+    reference_profile = analyze_reference(reference, use_memmap)
+    logger.info(f"Masterizando {len(targets)} archivos con {jobs} procesos")
+    results = []
+
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(reference, reference_profile, use_memmap, trace_memory)
+    ) as executor:
+        futures = {
+            executor.submit(_master_file, target, output_dir, formats, flac_level): target
+            for target in targets
+        }
+        for future in as_completed(futures):
+            target = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                summary = {
+                    'target': target,
+                    'output': None,
+                    'outputs': [],
+                    'success': False,
+                    'seconds': 0.0,
+                    'info': None,
+                    'timing': None,
+                    'error': str(e)
+                }
+
+            if summary['success']:
+                loudness = (summary['info'] or {}).get('loudness')
+                levels = ""
+                if loudness:
+                    levels = (f", {loudness['integrated']:.1f} LUFS, "
+                              f"{loudness['true_peak']:.1f} dBTP")
+                logger.info(f"OK {os.path.basename(target)} ({summary['seconds']:.1f} s{levels})")
+            else:
+                logger.error(f"ERROR {os.path.basename(target)}: {summary.get('error')}")
+            results.append(summary)
+
+    # Mantener el orden de entrada en el resumen
+    order = {target: i for i, target in enumerate(targets)}
+    results.sort(key=lambda item: order[item['target']])
+
+    report = {
+        'reference': reference,
+        'started': started.isoformat(timespec='seconds'),
+        'elapsed': round((datetime.now() - started).total_seconds(), 3),
+        'jobs': jobs,
+        'files': results
+    }
+    summary_path = os.path.join(output_dir, "resumen.json")
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False, default=float)
+
+    succeeded = sum(1 for item in results if item['success'])
+    logger.info(f"Completados {succeeded}/{len(results)}. Resumen en: {summary_path}")
+    return report
+
+
+def main(argv=None):
+    """Punto de entrada de la masterización por lotes sin interfaz gráfica."""
+    parser = argparse.ArgumentParser(
+        prog="master-w batch",
+        description="Masteriza varios archivos contra una misma referencia."
+    )
+    parser.add_argument('targets', nargs='+', help="Archivos, carpetas o patrones a masterizar")
+    parser.add_argument('-r', '--reference', required=True, help="Archivo de referencia")
+    parser.add_argument('-o', '--output', default="resultados", help="Carpeta de salida")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="Número de procesos (por defecto, uno por núcleo)")
+    parser.add_argument('--memmap', action='store_true',
+                        help="Respaldar el audio en disco para grabaciones muy largas")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Medir la memoria pico de cada etapa (más lento)")
+    parser.add_argument('-f', '--format', nargs='+', choices=list(EXPORT_FORMATS),
+                        default=[DEFAULT_FORMAT], dest='formats',
+                        help=f"Formatos de salida, escritos a la vez (por defecto: {DEFAULT_FORMAT})")
+    parser.add_argument('--flac-level', type=int, default=DEFAULT_FLAC_LEVEL,
+                        choices=range(MAX_FLAC_LEVEL + 1), metavar=f"0-{MAX_FLAC_LEVEL}",
+                        help=f"Nivel de compresión FLAC (por defecto: {DEFAULT_FLAC_LEVEL})")
+    args = parser.parse_args(argv)
+
+    # Carpetas y patrones glob se expanden aquí (en Windows la shell no lo hace)
+    targets = find_audio_files(args.targets)
+    if not targets:
+        parser.error("No se encontraron archivos a masterizar")
+
+    try:
+        report = run_batch(args.reference, targets, args.output, args.jobs, args.memmap,
+                           args.trace_memory, list(dict.fromkeys(args.formats)), args.flac_level)
+    except RuntimeError as e:
+        logging.getLogger('MasterW').error(str(e))
+        return 1
+    return 0 if all(item['success'] for item in report['files']) else 1
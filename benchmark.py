@@ -0,0 +1,286 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import soundfile as sf
+
+# Matriz completa: de 30 s a 60 min y de 44.1 a 192 kHz
+FULL_DURATIONS = [30, 300, 1200, 3600]
+FULL_RATES = [44100, 48000, 96000, 192000]
+
+# Operaciones medidas, en el orden del informe
+OPERATIONS = [
+    'load_target',
+    'get_audio_info',
+    'process_audio',
+    'save_result',
+    'calculate_spectrum',
+    'draw_waveforms',
+    'update_display',
+]
+
+
+def write_signal(file_path, duration, sample_rate, seed=0, block_size=1 << 18):
+    """Genera una señal estéreo sintética por bloques directamente en disco.
+
+    Mezcla tonos, ruido y una envolvente lenta para que el análisis y el
+    limitador trabajen como con música; nunca se crea la pista completa.
+    """
+    length = int(duration * sample_rate)
+    frequencies = np.array([55.0, 220.0, 880.0, 3520.0])
+    amplitudes = np.array([0.25, 0.15, 0.08, 0.04])
+
+    with sf.SoundFile(file_path, 'w', samplerate=sample_rate, channels=2, subtype='PCM_24') as f:
+        for block_index, start in enumerate(range(0, length, block_size)):
+            t = np.arange(start, min(start + block_size, length)) / sample_rate
+            rng = np.random.default_rng((seed, block_index))
+            envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 0.05 * t)
+            tones = np.sin(2 * np.pi * frequencies[:, None] * t) * amplitudes[:, None]
+            mono = tones.sum(axis=0)
+            left = (mono + 0.05 * rng.standard_normal(len(t))) * envelope
+            right = (mono * 0.9 + 0.05 * rng.standard_normal(len(t))) * envelope
+            f.write(np.stack([left, right], axis=1).astype(np.float32))
+
+
+class _HeadlessRoot:
+    """Sustituto mínimo de la ventana Tk para dibujar con el backend Agg."""
+
+    def winfo_exists(self):
+        return True
+
+    def after(self, delay, callback=None):
+        return None
+
+    def update_idletasks(self):
+        pass
+
+
+def _make_gui(processor):
+    """Crea la parte de visualización de la interfaz sobre un lienzo Agg."""
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from master_w_gui import MasterWGUI, THEME
+
+    gui = MasterWGUI.__new__(MasterWGUI)
+    gui.root = _HeadlessRoot()
+    gui.processor = processor
+    gui.logger = logging.getLogger('MasterW')
+    gui.figure = Figure(figsize=(8, 6), dpi=100, facecolor=THEME['bg_medium'])
+    gui.canvas = FigureCanvasAgg(gui.figure)
+    gs = gui.figure.add_gridspec(2, 1, height_ratios=[1, 1], hspace=0.3)
+    gui.waveform_ax = gui.figure.add_subplot(gs[0])
+    gui.spectrum_ax = gui.figure.add_subplot(gs[1])
+    gui._setup_plot_style()
+    gui.figure.subplots_adjust(left=0.08, right=0.92, top=0.92, bottom=0.1)
+    gui._init_plot_artists()
+    return gui
+
+
+def _timed(operation):
+    """Ejecuta 'operation' y devuelve (resultado, tiempo real, tiempo de CPU)."""
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    result = operation()
+    return result, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def run_case(duration, sample_rate, reference_path, workdir, use_memmap=False):
+    """Mide todas las operaciones para una duración y un sample rate.
+
+    Se ejecuta en un proceso propio para que el pico de memoria sea el del caso.
+    """
+    from audio_processor import AudioProcessor
+    from master_w_gui import TRACK_STYLES
+    from overview import average_spectrum
+    from timing import peak_rss_mb
+
+    logging.getLogger('MasterW').setLevel(logging.WARNING)
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    target_path = os.path.join(workdir, 'objetivo.wav')
+    write_signal(target_path, duration, sample_rate)
+
+    processor = AudioProcessor()
+    processor.use_memmap = use_memmap
+    processor.timing_folder = None
+    processor.result_cache_folder = None  # Medir siempre la masterización completa
+    processor.mg_config.max_length = max(processor.mg_config.max_length, duration + 60)
+    if not processor.load_reference(reference_path):
+        raise RuntimeError("No se pudo cargar la referencia")
+
+    operations = {}
+
+    def measure(name, operation):
+        result, wall, cpu = _timed(operation)
+        if result is False or (result is None and name == 'get_audio_info'):
+            raise RuntimeError(f"Falló la operación {name}")
+        operations[name] = {
+            'wall': round(wall, 4),
+            'cpu': round(cpu, 4),
+            'realtime': round(duration / wall, 2) if wall > 0 else None
+        }
+
+    measure('load_target', lambda: processor.load_target(target_path))
+    measure('get_audio_info', lambda: processor.get_audio_info('target'))
+    measure('process_audio', processor.process_audio)
+    measure('save_result', lambda: processor.save_result(os.path.join(workdir, 'resultado.wav')))
+
+    gui = _make_gui(processor)
+    channel = processor.target_audio[:, 0]
+    measure('calculate_spectrum', lambda: average_spectrum(channel, 8192, sample_rate))
+    measure('draw_waveforms', lambda: gui._draw_waveforms(TRACK_STYLES, ['target', 'result']))
+    measure('update_display', gui.update_audio_display)
+
+    record = {
+        'duration': duration,
+        'sample_rate': sample_rate,
+        'operations': operations,
+        'stages': processor.last_timing['stages'] if processor.last_timing else [],
+        'peak_rss_mb': peak_rss_mb()
+    }
+    processor.cleanup()
+    return record
+
+
+def machine_info():
+    """Datos del equipo para poder comparar ejecuciones."""
+    import scipy
+    import matplotlib
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'matplotlib': matplotlib.__version__,
+        'soundfile': sf.__version__
+    }
+
+
+def format_case(case):
+    """Una línea del informe: multiplicador de tiempo real por operación."""
+    header = f"{case['duration']:>6.0f} s {case['sample_rate'] / 1000:>5.1f} kHz"
+    if 'error' in case:
+        return f"{header}  ERROR: {case['error']}"
+    columns = []
+    for name in OPERATIONS:
+        realtime = case['operations'][name]['realtime']
+        columns.append(f"{realtime:>9.1f}x" if realtime is not None else f"{'-':>10}")
+    return f"{header}{''.join(columns)}  {case['peak_rss_mb'] or 0:>8.0f} MB"
+
+
+def compare(current, previous):
+    """Compara dos ejecuciones: relación de tiempos por caso y operación."""
+    previous_cases = {
+        (case['duration'], case['sample_rate']): case
+        for case in previous['cases'] if 'error' not in case
+    }
+    lines = []
+    for case in current['cases']:
+        old = previous_cases.get((case['duration'], case['sample_rate']))
+        if old is None or 'error' in case:
+            continue
+        ratios = []
+        for name in OPERATIONS:
+            new_wall = case['operations'][name]['wall']
+            old_wall = old['operations'].get(name, {}).get('wall')
+            if old_wall and new_wall:
+                ratios.append(f"{old_wall / new_wall:>9.2f}x")
+            else:
+                ratios.append(f"{'-':>10}")
+        lines.append(f"{case['duration']:>6.0f} s {case['sample_rate'] / 1000:>5.1f} kHz{''.join(ratios)}")
+    return lines
+
+
+def main(argv=None):
+    """Punto de entrada del banco de pruebas de rendimiento."""
+    parser = argparse.ArgumentParser(
+        prog="benchmark",
+        description="Mide el rendimiento de carga, análisis, masterización y visualización "
+                    "con señales sintéticas."
+    )
+    parser.add_argument('-d', '--durations', type=float, nargs='+', default=[30, 300],
+                        help="Duraciones en segundos (por defecto: 30 300)")
+    parser.add_argument('-r', '--rates', type=int, nargs='+', default=[44100, 96000],
+                        help="Sample rates en Hz (por defecto: 44100 96000)")
+    parser.add_argument('--full', action='store_true',
+                        help="Matriz completa: 30 s a 60 min, 44.1 a 192 kHz")
+    parser.add_argument('-o', '--output', default="benchmarks",
+                        help="Carpeta donde guardar los resultados")
+    parser.add_argument('--compare', help="Resultado anterior con el que comparar")
+    parser.add_argument('--memmap', action='store_true',
+                        help="Respaldar el audio en disco durante las pruebas")
+    parser.add_argument('--workdir', default=None,
+                        help="Carpeta temporal para las señales (necesita espacio en disco)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    logger = logging.getLogger('MasterW.benchmark')
+
+    durations = FULL_DURATIONS if args.full else args.durations
+    rates = FULL_RATES if args.full else args.rates
+
+    workdir = tempfile.mkdtemp(prefix='masterw_bench_', dir=args.workdir)
+    context = multiprocessing.get_context('spawn')
+    report = {
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'machine': machine_info(),
+        'memmap': args.memmap,
+        'cases': []
+    }
+
+    logger.info(f"{'':>16}" + ''.join(f"{name[:9]:>10}" for name in OPERATIONS) + f"{'RSS':>11}")
+    try:
+        reference_path = os.path.join(workdir, 'referencia.wav')
+        write_signal(reference_path, 30, 44100, seed=1)
+
+        for sample_rate in rates:
+            for duration in durations:
+                case_dir = os.path.join(workdir, f"caso_{int(duration)}_{sample_rate}")
+                # Un proceso nuevo por caso: pico de memoria y cachés independientes
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    future = executor.submit(
+                        run_case, duration, sample_rate, reference_path, case_dir, args.memmap
+                    )
+                    try:
+                        case = future.result()
+                    except Exception as e:
+                        case = {'duration': duration, 'sample_rate': sample_rate, 'error': str(e) or type(e).__name__}
+                shutil.rmtree(case_dir, ignore_errors=True)
+                report['cases'].append(case)
+                logger.info(format_case(case))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(args.output, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_path = os.path.join(args.output, f"benchmark_{timestamp}.json")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    logger.info(f"Resultados guardados en: {output_path}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+        logger.info(f"Mejora respecto a {os.path.basename(args.compare)} (tiempo anterior / actual):")
+        for line in compare(report, previous):
+            logger.info(line)
+
+    return 0 if all('error' not in case for case in report['cases']) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Módulos que la aplicación importa realmente, leídos por master_w.spec
+TRACE_FILE = os.path.join("build", "traced_modules.txt")
+
+# Perfiles de empaquetado de master_w.spec
+PROFILES = ['full', 'slim']
+
+# Arranques en frío que se promedian al comparar
+STARTUP_RUNS = 3
+
+
+def _exercise_app(workdir):
+    """Recorre los caminos de la aplicación para que se importe todo lo que usan.
+
+    Se ejecuta en un intérprete limpio: carga la interfaz, precarga los
+    módulos de masterización y masteriza señales cortas en memoria y con
+    archivos, con un objetivo a otro sample rate para pasar por el remuestreo.
+    """
+    import numpy as np
+    import soundfile as sf
+
+    sys.argv = [sys.argv[0]]
+    os.chdir(workdir)
+    import main
+    import batch
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.backends.backend_tkagg
+    import matplotlib.figure
+    import matplotlib.widgets
+    from audio_processor import AudioProcessor
+    from master_w_gui import MasterWGUI
+    from worker import MasteringWorker
+
+    rng = np.random.default_rng(0)
+    for name, sample_rate in [('objetivo.wav', 48000), ('referencia.wav', 44100)]:
+        length = 10 * sample_rate
+        t = np.arange(length) / sample_rate
+        mono = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.standard_normal(length)
+        sf.write(name, np.stack([mono, mono * 0.9], axis=1), sample_rate, subtype='PCM_24')
+
+    processor = AudioProcessor()
+    processor.timing_folder = None
+    processor.warm_up()
+    for in_memory in [True, False]:
+        processor.in_memory = in_memory
+        if not (processor.load_target('objetivo.wav') and processor.load_reference('referencia.wav')):
+            raise RuntimeError("No se pudieron cargar las señales de prueba")
+        if not processor.process_audio():
+            raise RuntimeError("Falló la masterización de prueba")
+        processor.get_audio_info('result')
+        processor.save_result('resultado.wav')
+    processor.process_preview((0, 5))
+    processor.cleanup()
+
+
+def trace_modules(output=TRACE_FILE):
+    """Guarda en 'output' los módulos importados al recorrer la aplicación."""
+    with tempfile.TemporaryDirectory(prefix='masterw_trace_') as workdir:
+        modules_path = os.path.join(workdir, 'modules.txt')
+        subprocess.run(
+            [sys.executable, '-c', f"import build_profile; build_profile._trace_child({modules_path!r})"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True
+        )
+        with open(modules_path, encoding='utf-8') as f:
+            modules = f.read().split()
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(modules) + '\n')
+    print(f"{len(modules)} módulos trazados en: {output}")
+    return modules
+
+
+def _trace_child(modules_path):
+    """Recorre la aplicación en este intérprete y escribe sus módulos cargados."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory(prefix='masterw_run_') as workdir:
+        _exercise_app(workdir)
+    # Sin alias internos (extensiones Cython registradas con otro nombre)
+    modules = sorted(
+        name for name, module in sys.modules.items()
+        if getattr(module, '__spec__', None) is not None and module.__spec__.name == name
+        and name not in ('__main__', '__mp_main__') and '.tests' not in name
+    )
+    with open(modules_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(modules))
+
+
+def build(profile):
+    """Empaqueta la aplicación con el perfil indicado en dist/<perfil>."""
+    if profile == 'slim':
+        # Trazar siempre: la lista depende de las versiones instaladas
+        trace_modules()
+
+    env = dict(os.environ, MASTERW_BUILD_PROFILE=profile)
+    subprocess.run(
+        [sys.executable, '-m', 'PyInstaller', 'master_w.spec', '--noconfirm',
+         '--distpath', os.path.join('dist', profile),
+         '--workpath', os.path.join('build', profile)],
+        env=env,
+        check=True
+    )
+    return _find_executable(profile)
+
+
+def _find_executable(profile):
+    folder = os.path.join('dist', profile)
+    for name in ['Master-W.exe', 'Master-W']:
+        path = os.path.join(folder, name)
+        if os.path.isfile(path):
+            return path
+    raise FileNotFoundError(f"No se encontró el ejecutable en {folder}")
+
+
+def bundle_size_mb(path):
+    """Tamaño del ejecutable (o de la carpeta del paquete) en MB."""
+    if os.path.isfile(path):
+        return os.path.getsize(path) / (1024 * 1024)
+    total = 0
+    for folder, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(folder, name)) for name in files)
+    return total / (1024 * 1024)
+
+
+def cold_start_seconds(executable, runs=STARTUP_RUNS):
+    """Tiempo medio de arranque del ejecutable sin abrir la ventana.
+
+    Mide 'batch --help': incluye la extracción del paquete, el arranque del
+    intérprete y las importaciones iniciales, pero no necesita pantalla.
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [executable, 'batch', '--help'],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        times.append(time.perf_counter() - start)
+    return sum(times) / len(times)
+
+
+def compare():
+    """Empaqueta los dos perfiles e informa de su tamaño y su arranque en frío."""
+    results = {}
+    for profile in PROFILES:
+        executable = build(profile)
+        results[profile] = (bundle_size_mb(executable), cold_start_seconds(executable))
+
+    print(f"{'Perfil':<8}{'Tamaño':>12}{'Arranque':>12}")
+    for profile, (size, startup) in results.items():
+        print(f"{profile:<8}{size:>9.1f} MB{startup:>10.2f} s")
+    full_size, full_startup = results['full']
+    slim_size, slim_startup = results['slim']
+    print(f"Reducción: {100 * (1 - slim_size / full_size):.0f}% de tamaño, "
+          f"{100 * (1 - slim_startup / full_startup):.0f}% de arranque")
+    return results
+
+
+def main(argv=None):
+    """Punto de entrada de las herramientas de empaquetado."""
+    parser = argparse.ArgumentParser(
+        prog="build_profile",
+        description="Traza los módulos usados por Master-W y empaqueta perfiles completos o reducidos."
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('trace', help=f"Genera {TRACE_FILE} con los módulos usados")
+    build_parser = subparsers.add_parser('build', help="Empaqueta un perfil en dist/<perfil>")
+    build_parser.add_argument('profile', choices=PROFILES)
+    subparsers.add_parser('compare', help="Empaqueta ambos perfiles y compara tamaño y arranque")
+    args = parser.parse_args(argv)
+
+    if args.command == 'trace':
+        trace_modules()
+    elif args.command == 'build':
+        build(args.profile)
+    else:
+        compare()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import soundfile as sf
+
+# Formatos de exportación: contenedor y subtipo de libsndfile, extensión y dither
+EXPORT_FORMATS = {
+    'pcm16': {
+        'format': 'WAV',
+        'subtype': 'PCM_16',
+        'extension': '.wav',
+        'dither': True,
+        'label': "WAV 16 bits (con dither)"
+    },
+    'pcm24': {
+        'format': 'WAV',
+        'subtype': 'PCM_24',
+        'extension': '.wav',
+        'dither': False,
+        'label': "WAV 24 bits"
+    },
+    'float32': {
+        'format': 'WAV',
+        'subtype': 'FLOAT',
+        'extension': '.wav',
+        'dither': False,
+        'label': "WAV 32 bits float"
+    },
+    'flac': {
+        'format': 'FLAC',
+        'subtype': 'PCM_24',
+        'extension': '.flac',
+        'dither': False,
+        'label': "FLAC 24 bits"
+    },
+}
+
+DEFAULT_FORMAT = 'pcm24'
+
+# Nivel de compresión FLAC, de 0 (más rápido) a 8 (archivo más pequeño)
+DEFAULT_FLAC_LEVEL = 5
+MAX_FLAC_LEVEL = 8
+
+# Bloques en cola por archivo antes de esperar a que se escriban
+MAX_PENDING_BLOCKS = 4
+
+
+def format_for_path(file_path):
+    """Formato de exportación por defecto según la extensión del archivo."""
+    extension = os.path.splitext(file_path)[1].lower()
+    for name, spec in EXPORT_FORMATS.items():
+        if spec['extension'] == extension and spec['format'] != 'WAV':
+            return name
+    return DEFAULT_FORMAT
+
+
+def normalize_destinations(destinations):
+    """Convierte los destinos indicados en una lista de diccionarios.
+
+    Cada destino puede ser una ruta (el formato se deduce de la extensión),
+    una tupla (ruta, formato) o un diccionario con 'path', 'format' y,
+    opcionalmente, 'flac_level'. También se admite una lista de ellos.
+    """
+    if isinstance(destinations, (str, os.PathLike, tuple, dict)):
+        destinations = [destinations]
+
+    normalized = []
+    for destination in destinations:
+        if isinstance(destination, dict):
+            entry = dict(destination)
+        elif isinstance(destination, tuple):
+            entry = {'path': destination[0], 'format': destination[1]}
+        else:
+            entry = {'path': destination}
+
+        entry['path'] = os.fspath(entry['path'])
+        entry.setdefault('format', None)
+        entry['format'] = entry['format'] or format_for_path(entry['path'])
+        entry.setdefault('flac_level', DEFAULT_FLAC_LEVEL)
+        if entry['format'] not in EXPORT_FORMATS:
+            raise ValueError(f"Formato de exportación desconocido: {entry['format']}")
+        if not 0 <= entry['flac_level'] <= MAX_FLAC_LEVEL:
+            raise ValueError(f"Nivel de compresión FLAC fuera de rango (0-{MAX_FLAC_LEVEL})")
+        normalized.append(entry)
+    return normalized
+
+
+class TpdfDither:
+    """Cuantización a enteros con dither triangular (TPDF) de 1 LSB.
+
+    Se cuantiza aquí, y no en libsndfile, para que el ruido añadido sea
+    independiente de un bloque a otro y del orden de escritura.
+    """
+
+    def __init__(self, bits=16, seed=None):
+        self.scale = float(2 ** (bits - 1))
+        self.rng = np.random.default_rng(seed)
+
+    def quantize(self, block):
+        noise = self.rng.random(block.shape, dtype=np.float32) - self.rng.random(block.shape, dtype=np.float32)
+        scaled = block * np.float32(self.scale) + noise
+        np.round(scaled, out=scaled)
+        np.clip(scaled, -self.scale, self.scale - 1, out=scaled)
+        return scaled.astype(np.int16)
+
+
+class StreamingExporter:
+    """Escribe el mismo audio en varios archivos y formatos en una sola pasada.
+
+    Cada archivo tiene su propio hilo: libsndfile libera el GIL al codificar,
+    así que los destinos se escriben a la vez y mientras se sigue procesando
+    el siguiente bloque. La cola de cada archivo está limitada a
+    MAX_PENDING_BLOCKS bloques para acotar la memoria. Los bloques no deben
+    modificarse después de pasarlos a write().
+
+    Si 'source_rate' difiere de 'sample_rate', los bloques se remuestrean
+    una sola vez antes de repartirlos entre los destinos.
+    """
+
+    def __init__(self, destinations, sample_rate, channels=2, source_rate=None):
+        self.destinations = normalize_destinations(destinations)
+        self.outputs = []
+        self.resampler = None
+        if source_rate and int(source_rate) != int(sample_rate):
+            from resampler import StreamingResampler
+            self.resampler = StreamingResampler(source_rate, sample_rate, channels)
+        try:
+            for destination in self.destinations:
+                spec = EXPORT_FORMATS[destination['format']]
+                options = {}
+                if spec['format'] == 'FLAC':
+                    options['compression_level'] = destination['flac_level'] / MAX_FLAC_LEVEL
+                output = {
+                    'path': destination['path'],
+                    'file': sf.SoundFile(
+                        destination['path'], 'w',
+                        samplerate=sample_rate,
+                        channels=channels,
+                        format=spec['format'],
+                        subtype=spec['subtype'],
+                        **options
+                    ),
+                    'dither': TpdfDither(16) if spec['dither'] else None,
+                    'executor': ThreadPoolExecutor(max_workers=1),
+                    'pending': deque()
+                }
+                self.outputs.append(output)
+        except Exception:
+            self.abort()
+            raise
+
+    @property
+    def paths(self):
+        return [destination['path'] for destination in self.destinations]
+
+    @staticmethod
+    def _write(output, block):
+        if output['dither'] is not None:
+            block = output['dither'].quantize(block)
+        output['file'].write(block)
+
+    def write(self, block):
+        """Encola un bloque en todos los destinos."""
+        if self.resampler is not None:
+            block = self.resampler.process(block)
+        self._enqueue(block)
+
+    def _enqueue(self, block):
+        if not len(block):
+            return
+        for output in self.outputs:
+            pending = output['pending']
+            while len(pending) >= MAX_PENDING_BLOCKS:
+                pending.popleft().result()
+            pending.append(output['executor'].submit(self._write, output, block))
+
+    def close(self):
+        """Espera a que se escriba todo y cierra los archivos.
+
+        Si algún destino falla, se eliminan todos los archivos parciales y
+        se propaga el error.
+        """
+        try:
+            if self.resampler is not None:
+                self._enqueue(self.resampler.flush())
+                self._close_resampler()
+            for output in self.outputs:
+                while output['pending']:
+                    output['pending'].popleft().result()
+        except Exception:
+            self.abort()
+            raise
+
+        for output in self.outputs:
+            output['executor'].shutdown()
+            output['file'].close()
+        self.outputs = []
+
+    def abort(self):
+        """Cancela la exportación y elimina los archivos a medio escribir."""
+        self._close_resampler()
+        for output in self.outputs:
+            output['executor'].shutdown(cancel_futures=True)
+            output['file'].close()
+            try:
+                os.remove(output['path'])
+            except OSError:
+                pass
+        self.outputs = []
+
+    def _close_resampler(self):
+        if self.resampler is not None:
+            self.resampler.close()
+            self.resampler = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
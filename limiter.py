@@ -0,0 +1,84 @@
+import math
+import numpy as np
+from scipy import signal
+from scipy.ndimage import maximum_filter1d
+from matchering.dsp import rectify, flip, max_mix
+from matchering.utils import make_odd, ms_to_samples
+
+
+class StreamingLimiter:
+    """Limitador de matchering (Hyrax) aplicado por bloques.
+
+    Las etapas no causales (ventanas de máximo y el filtro de ataque con
+    filtfilt) se calculan sobre el bloque más un margen de contexto a cada
+    lado; las etapas causales de hold y release conservan el estado de sus
+    filtros entre bloques. El resultado coincide con limitar la pista entera.
+    """
+
+    def __init__(self, config, margin=4096):
+        self.config = config
+        self.margin = margin
+        limiter = config.limiter
+        sample_rate = config.internal_sample_rate
+
+        self.attack = ms_to_samples(limiter.attack, sample_rate)
+        attack_coef = math.exp(limiter.attack_filter_coefficient / self.attack)
+        self.attack_b = [1 - attack_coef]
+        self.attack_a = [1, -attack_coef]
+
+        self.hold = ms_to_samples(limiter.hold, sample_rate)
+        self.hold_b, self.hold_a = signal.butter(
+            limiter.hold_filter_order,
+            limiter.hold_filter_coefficient,
+            fs=sample_rate,
+        )
+        self.release_b, self.release_a = signal.butter(
+            limiter.release_filter_order,
+            limiter.release_filter_coefficient / limiter.release,
+            fs=sample_rate,
+        )
+
+        # Estado inicial nulo, igual que lfilter sobre la pista completa
+        self.hold_zi = np.zeros(max(len(self.hold_a), len(self.hold_b)) - 1)
+        self.release_zi = np.zeros(max(len(self.release_a), len(self.release_b)) - 1)
+
+    def _slide_attack(self, array):
+        window_size = make_odd(self.attack)
+        return maximum_filter1d(array, size=(2 * window_size - 1))
+
+    def _slide_hold(self, array):
+        half_window_size = (self.hold - 1) // 2
+        array = np.pad(array, (half_window_size, 0))
+        return maximum_filter1d(array, size=self.hold)[:-half_window_size]
+
+    def process(self, block, core_start, core_end):
+        """Limita las muestras block[core_start:core_end].
+
+        'block' incluye el contexto alrededor del núcleo; los bloques deben
+        pasarse en orden y sin huecos entre núcleos consecutivos.
+        """
+        gain_hard_clip = flip(1.0 / rectify(block, self.config.threshold))
+
+        # Ataque: ventana de máximo centrada y suavizado de fase cero
+        gain_hard_clip_slided = self._slide_attack(gain_hard_clip)
+        gain_attack = signal.filtfilt(self.attack_b, self.attack_a, gain_hard_clip_slided)
+
+        # Hold / release: filtros causales con estado entre bloques
+        hold_input = self._slide_hold(gain_hard_clip_slided)[core_start:core_end]
+        hold_output, self.hold_zi = signal.lfilter(
+            self.hold_b, self.hold_a, hold_input, zi=self.hold_zi
+        )
+        release_output, self.release_zi = signal.lfilter(
+            self.release_b,
+            self.release_a,
+            np.maximum(hold_input, hold_output),
+            zi=self.release_zi,
+        )
+        gain_release = np.maximum(hold_output, release_output)
+
+        gain = flip(max_mix(
+            gain_hard_clip[core_start:core_end],
+            gain_attack[core_start:core_end],
+            gain_release,
+        ))
+        return block[core_start:core_end] * gain[:, None]
@@ -0,0 +1,210 @@
+import numpy as np
+from scipy import signal
+
+# Umbrales de la norma ITU-R BS.1770-4 / EBU R128
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+LRA_RELATIVE_GATE = -20.0
+TRUE_PEAK_OVERSAMPLING = 4
+
+# Suelo para valores no medibles (pistas demasiado cortas o silencio)
+FLOOR_DB = -100.0
+
+
+def k_weighting(sample_rate):
+    """Filtro de ponderación K como secciones de segundo orden (sos).
+
+    Coeficientes calculados para cualquier sample rate con las fórmulas de
+    libebur128; a 48 kHz coinciden con los de la norma.
+    """
+    # Etapa 1: estante de agudos (modelo acústico de la cabeza)
+    f0 = 1681.974450955533
+    gain = 3.999843853973347
+    q = 0.7071752369554196
+    k = np.tan(np.pi * f0 / sample_rate)
+    vh = 10 ** (gain / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [
+        (vh + vb * k / q + k * k) / a0,
+        2 * (k * k - vh) / a0,
+        (vh - vb * k / q + k * k) / a0,
+        1,
+        2 * (k * k - 1) / a0,
+        (1 - k / q + k * k) / a0,
+    ]
+
+    # Etapa 2: paso alto RLB
+    f0 = 38.13547087602444
+    q = 0.5003270373238773
+    k = np.tan(np.pi * f0 / sample_rate)
+    a0 = 1 + k / q + k * k
+    high_pass = [
+        1,
+        -2,
+        1,
+        1,
+        2 * (k * k - 1) / a0,
+        (1 - k / q + k * k) / a0,
+    ]
+
+    return np.array([shelf, high_pass])
+
+
+def channel_weights(channels):
+    """Pesos por canal; en 5.0/5.1 los surround pesan +1.5 dB y el LFE no cuenta."""
+    if channels == 5:
+        return np.array([1.0, 1.0, 1.0, 1.41, 1.41])
+    if channels == 6:
+        return np.array([1.0, 1.0, 1.0, 0.0, 1.41, 1.41])
+    return np.ones(channels)
+
+
+def _power_to_lufs(power):
+    with np.errstate(divide='ignore'):
+        return -0.691 + 10 * np.log10(power)
+
+
+def _gated_loudness(powers, relative_gate):
+    """Loudness integrada de una serie de potencias con doble compuerta."""
+    loudness = _power_to_lufs(powers)
+    gated = powers[loudness > ABSOLUTE_GATE]
+    if len(gated) == 0:
+        return FLOOR_DB, loudness, -np.inf
+
+    threshold = _power_to_lufs(gated.mean()) + relative_gate
+    gated = powers[(loudness > ABSOLUTE_GATE) & (loudness > threshold)]
+    if len(gated) == 0:
+        return FLOOR_DB, loudness, threshold
+    return float(_power_to_lufs(gated.mean())), loudness, threshold
+
+
+def _subblock_energies(audio, sample_rate, subblock_size, chunk_subblocks=64):
+    """Energía ponderada K de cada sub-bloque de 100 ms, por canal."""
+    channels = audio.shape[1]
+    sos = k_weighting(sample_rate)
+    zi = np.zeros((sos.shape[0], 2, channels))
+    chunk_size = subblock_size * chunk_subblocks
+
+    num_subblocks = len(audio) // subblock_size
+    energies = np.empty((num_subblocks, channels))
+    for start in range(0, num_subblocks * subblock_size, chunk_size):
+        chunk = np.asarray(audio[start:start + chunk_size], dtype=np.float64)
+        chunk = chunk[:len(chunk) - len(chunk) % subblock_size]
+        filtered, zi = signal.sosfilt(sos, chunk, axis=0, zi=zi)
+        first = start // subblock_size
+        energies[first:first + len(chunk) // subblock_size] = np.square(filtered).reshape(
+            -1, subblock_size, channels
+        ).sum(axis=1)
+
+    return energies
+
+
+def _windowed_power(weighted, window):
+    """Potencia media en ventanas de 'window' sub-bloques con salto de uno."""
+    if len(weighted) < window:
+        return np.empty(0)
+    cumulative = np.concatenate([[0.0], np.cumsum(weighted)])
+    return (cumulative[window:] - cumulative[:-window]) / window
+
+
+def _interpolation_phases(taps_per_phase=20):
+    """Fases del filtro de interpolación 4x (el mismo diseño que resample_poly).
+
+    La fase 0 reproduce exactamente las muestras originales, así que solo se
+    devuelven las demás, invertidas para aplicarlas como producto matricial.
+    """
+    up = TRUE_PEAK_OVERSAMPLING
+    taps = signal.firwin(up * taps_per_phase + 1, 1.0 / up, window=('kaiser', 5.0)) * up
+    phases = np.stack([taps[phase::up][:taps_per_phase] for phase in range(1, up)], axis=1)
+    return np.ascontiguousarray(phases[::-1], dtype=np.float32)
+
+
+def true_peak(audio, chunk_size=1 << 16):
+    """Peak real (lineal) con sobremuestreo 4x, calculado por bloques.
+
+    Cada bloque se interpola con un único producto matricial de su vista de
+    ventanas deslizantes por las fases del filtro, sin crear la señal
+    sobremuestreada completa.
+    """
+    if audio.ndim == 1:
+        audio = audio.reshape(-1, 1)
+    length, channels = audio.shape
+    phases = _interpolation_phases()
+    taps = len(phases)
+
+    peak = 0.0
+    context = np.zeros((taps - 1, channels), dtype=np.float32)
+    for start in range(0, length + taps - 1, chunk_size):
+        chunk = np.asarray(audio[start:start + chunk_size], dtype=np.float32)
+        if start + chunk_size >= length:
+            # Ceros tras el final, como en la interpolación de la pista entera
+            chunk = np.concatenate([chunk, np.zeros((taps - 1, channels), dtype=np.float32)])
+        if len(chunk):
+            peak = max(peak, float(chunk.max()), float(-chunk.min()))
+        buffer = np.concatenate([context, chunk])
+        if len(buffer) < taps:
+            break
+        # Un producto matricial por canal (contiguo) es mucho más rápido que por lotes
+        for samples in np.ascontiguousarray(buffer.T):
+            windows = np.lib.stride_tricks.sliding_window_view(samples, taps)
+            interpolated = windows @ phases
+            peak = max(peak, float(interpolated.max()), float(-interpolated.min()))
+        context = buffer[-(taps - 1):]
+        if start + chunk_size >= length:
+            break
+
+    return peak
+
+
+def _weighted_subblocks(audio, sample_rate):
+    """Potencia ponderada K de cada sub-bloque de 100 ms, sumando canales."""
+    subblock_size = int(round(sample_rate * 0.1))
+    energies = _subblock_energies(audio, sample_rate, subblock_size)
+    return energies @ channel_weights(audio.shape[1]) / subblock_size
+
+
+def integrated_loudness(audio, sample_rate):
+    """Solo la loudness integrada en LUFS, sin LRA ni true peak (más rápida)."""
+    if audio.ndim == 1:
+        audio = audio.reshape(-1, 1)
+    integrated, _, _ = _gated_loudness(_windowed_power(_weighted_subblocks(audio, sample_rate), 4), RELATIVE_GATE)
+    return integrated
+
+
+def measure_loudness(audio, sample_rate):
+    """Mide loudness según ITU-R BS.1770-4 / EBU R128.
+
+    Devuelve loudness integrada, máximos momentáneo (400 ms) y de corto plazo
+    (3 s) en LUFS, rango de loudness (LRA) en LU y true peak en dBTP, junto
+    con las series momentánea y de corto plazo cada 100 ms.
+    """
+    if audio.ndim == 1:
+        audio = audio.reshape(-1, 1)
+
+    weighted = _weighted_subblocks(audio, sample_rate)
+
+    # Bloques de 400 ms y 3 s con salto de 100 ms
+    momentary_power = _windowed_power(weighted, 4)
+    short_term_power = _windowed_power(weighted, 30)
+
+    integrated, momentary, _ = _gated_loudness(momentary_power, RELATIVE_GATE)
+
+    loudness_range = 0.0
+    _, short_term, lra_threshold = _gated_loudness(short_term_power, LRA_RELATIVE_GATE)
+    lra_values = short_term[(short_term > ABSOLUTE_GATE) & (short_term > lra_threshold)]
+    if len(lra_values):
+        low, high = np.percentile(lra_values, [10, 95])
+        loudness_range = float(high - low)
+
+    peak = true_peak(audio)
+
+    return {
+        'integrated': integrated,
+        'momentary_max': float(max(np.max(momentary, initial=FLOOR_DB), FLOOR_DB)),
+        'short_term_max': float(max(np.max(short_term, initial=FLOOR_DB), FLOOR_DB)),
+        'loudness_range': loudness_range,
+        'true_peak': float(20 * np.log10(peak)) if peak > 0 else FLOOR_DB,
+        'momentary': momentary,
+        'short_term': short_term,
+    }
@@ -1,10 +1,10 @@
 import tkinter as tk
 from tkinter import ttk
 import logging
+import multiprocessing
 import sys
-from audio_processor import AudioProcessor
-from master_w_gui import MasterWGUI
 import os
+from timing import StageTimer, stage
 
 def configure_styles():
     """Configura los estilos globales de la aplicación."""
@@ -36,14 +36,18 @@ def setup_logging():
         ]
     )
 
-def main():
+def main(profile_imports=False, save_timing=False):
     # Configurar logging
     setup_logging()
     logger = logging.getLogger(__name__)
     
+    # Perfil de arranque: tiempos de importación y creación de la interfaz
+    timer = StageTimer({'mode': 'startup'}).start() if profile_imports else None
+    
     try:
         # Crear ventana principal
-        root = tk.Tk()
+        with stage(timer, 'tk'):
+            root = tk.Tk()
         root.title("Master-W")
         
         # Configurar ventana
@@ -65,9 +69,17 @@ def main():
         except Exception as e:
             logger.warning(f"No se pudo cargar el icono: {e}")
         
+        # Solo los módulos ligeros: matplotlib y matchering se cargan en segundo plano
+        with stage(timer, 'import_app'):
+            from audio_processor import AudioProcessor
+            from master_w_gui import MasterWGUI
+        
         # Crear procesador e interfaz
-        processor = AudioProcessor()
-        app = MasterWGUI(root, processor)
+        with stage(timer, 'window'):
+            processor = AudioProcessor()
+            if save_timing:
+                processor.timing_folder = os.path.join(processor.results_folder, "tiempos")
+            app = MasterWGUI(root, processor, timer)
         
         # Centrar la ventana
         window_width = 1200
@@ -82,9 +94,30 @@ def main():
         logger.info("Iniciando Master-W")
         root.mainloop()
         
+        # Detener una masterización en curso y eliminar archivos de respaldo
+        app.stop_worker()
+        processor.cleanup()
+        
     except Exception as e:
         logger.error(f"Error al iniciar la aplicación: {str(e)}")
         raise
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Necesario para los procesos de masterización en el ejecutable empaquetado
+    multiprocessing.freeze_support()
+    
+    # Modo por lotes sin interfaz: python main.py batch -r ref.wav archivos...
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        setup_logging()
+        from batch import main as batch_main
+        sys.exit(batch_main(sys.argv[2:]))
+    
+    # Índice de referencias: python main.py library index carpeta / suggest objetivo.wav
+    if len(sys.argv) > 1 and sys.argv[1] == 'library':
+        setup_logging()
+        from reference_library import main as library_main
+        sys.exit(library_main(sys.argv[2:]))
+    main(
+        profile_imports='--profile-imports' in sys.argv[1:],
+        save_timing='--timing' in sys.argv[1:]
+    )
\ No newline at end of file
@@ -1,29 +1,75 @@
 # -*- mode: python ; coding: utf-8 -*-
 
+import importlib.util
+import os
 import sys
 from PyInstaller.utils.hooks import collect_data_files, collect_submodules
 
 block_cipher = None
 
-# Recolectar datos y módulos adicionales necesarios
-numpy_data = collect_data_files('numpy')
-scipy_data = collect_data_files('scipy')
-matplotlib_data = collect_data_files('matplotlib')
-statsmodels_data = collect_data_files('statsmodels')
-pandas_data = collect_data_files('pandas')
-pil_data = collect_data_files('PIL')
+# Perfil de empaquetado (variable MASTERW_BUILD_PROFILE):
+#   full - recoge numpy, scipy, matplotlib, statsmodels, pandas y PIL enteros
+#   slim - solo los módulos que usa la aplicación, trazados con build_profile.py
+profile = os.environ.get('MASTERW_BUILD_PROFILE', 'full')
 
-# Recolectar submódulos necesarios
-statsmodels_submodules = collect_submodules('statsmodels')
-pandas_submodules = collect_submodules('pandas')
-matplotlib_submodules = collect_submodules('matplotlib')
-pil_submodules = collect_submodules('PIL')
+# Paquetes grandes de los que solo se empaqueta lo trazado en el perfil slim
+SLIM_PACKAGES = ['pandas', 'statsmodels', 'scipy', 'matplotlib', 'PIL', 'numba', 'llvmlite']
 
-a = Analysis(
-    ['main.py'],
-    pathex=[],
-    binaries=[],
-    datas=[
+
+def package_modules(package):
+    """Nombres de los módulos de un paquete, sin importarlos."""
+    spec = importlib.util.find_spec(package)
+    if spec is None or not spec.submodule_search_locations:
+        return []
+    modules = []
+    for location in spec.submodule_search_locations:
+        for folder, _, files in os.walk(location):
+            relative = os.path.relpath(folder, location)
+            prefix = package if relative == '.' else f"{package}.{relative.replace(os.sep, '.')}"
+            for name in files:
+                module, ext = name.split('.', 1)[0], os.path.splitext(name)[1]
+                if ext not in ('.py', '.pyd', '.so') or module == '__init__':
+                    continue
+                modules.append(f"{prefix}.{module}")
+            if relative != '.' and '__init__.py' in files:
+                modules.append(prefix)
+    return modules
+
+
+excludes = [
+    'PyQt5', 'PyQt6', 'PySide6', 'PySide2',  # GUIs no usadas
+    'IPython', 'jupyter', 'notebook',  # Entornos interactivos
+    'opencv', 'cv2',  # No usamos visión por computadora
+]
+
+if profile == 'slim':
+    # python build_profile.py build slim genera la lista antes de empaquetar
+    with open(os.path.join('build', 'traced_modules.txt'), encoding='utf-8') as f:
+        traced = set(f.read().split())
+
+    datas = [('icon.ico', '.')]
+    hiddenimports = sorted(traced)
+    # Lo que nunca se importa al usar la aplicación (tests, extras, backends...)
+    for package in SLIM_PACKAGES:
+        excludes.extend(module for module in package_modules(package) if module not in traced)
+    # Los datos de matplotlib los añade su hook, solo para el backend usado
+    hooksconfig = {'matplotlib': {'backends': ['TkAgg', 'Agg']}}
+else:
+    # Recolectar datos y módulos adicionales necesarios
+    numpy_data = collect_data_files('numpy')
+    scipy_data = collect_data_files('scipy')
+    matplotlib_data = collect_data_files('matplotlib')
+    statsmodels_data = collect_data_files('statsmodels')
+    pandas_data = collect_data_files('pandas')
+    pil_data = collect_data_files('PIL')
+
+    # Recolectar submódulos necesarios
+    statsmodels_submodules = collect_submodules('statsmodels')
+    pandas_submodules = collect_submodules('pandas')
+    matplotlib_submodules = collect_submodules('matplotlib')
+    pil_submodules = collect_submodules('PIL')
+
+    datas = [
         ('icon.ico', '.'),
         *numpy_data,
         *scipy_data,
@@ -31,8 +77,8 @@ a = Analysis(
         *statsmodels_data,
         *pandas_data,
         *pil_data
-    ],
-    hiddenimports=[
+    ]
+    hiddenimports = [
         'numpy',
         'scipy',
         'scipy.signal',
@@ -54,15 +100,19 @@ a = Analysis(
         *pandas_submodules,
         *matplotlib_submodules,
         *pil_submodules
-    ],
+    ]
+    hooksconfig = {}
+
+a = Analysis(
+    ['main.py'],
+    pathex=[],
+    binaries=[],
+    datas=datas,
+    hiddenimports=hiddenimports,
     hookspath=[],
-    hooksconfig={},
+    hooksconfig=hooksconfig,
     runtime_hooks=[],
-    excludes=[
-        'PyQt5', 'PyQt6', 'PySide6', 'PySide2',  # GUIs no usadas
-        'IPython', 'jupyter', 'notebook',  # Entornos interactivos
-        'opencv', 'cv2',  # No usamos visión por computadora
-    ],
+    excludes=excludes,
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
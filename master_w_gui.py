@@ -2,13 +2,16 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
 import logging
 import queue
 import os
+from collections import deque
 from datetime import datetime
+from audio_processor import PREVIEW_SECONDS
+from export import DEFAULT_FORMAT, EXPORT_FORMATS, format_for_path
+from overview import build_overview
+from timing import stage
+from worker import MasteringWorker
 
 # Configuración de colores y estilos
 THEME = {
@@ -36,25 +39,115 @@ THEME = {
     'padding_large': 20,
 }
 
+# Colores para cada tipo de audio
+TRACK_STYLES = {
+    'target': {'color': '#00CC66', 'label': 'Original'},
+    'reference': {'color': '#FF6B6B', 'label': 'Referencia'},
+    'result': {'color': '#4ECDC4', 'label': 'Masterizado'}
+}
+
+# Tramo mínimo a previsualizar; una selección más corta se trata como un clic
+MIN_PREVIEW_SECONDS = 1.0
+
+# Marcadores de frecuencia del espectro
+FREQ_BANDS = {
+    '20Hz': 20,
+    '50Hz': 50,
+    '100Hz': 100,
+    '200Hz': 200,
+    '500Hz': 500,
+    '1kHz': 1000,
+    '2kHz': 2000,
+    '5kHz': 5000,
+    '10kHz': 10000,
+    '20kHz': 20000
+}
+
+# Líneas que conserva el log de la interfaz (las más antiguas se descartan)
+LOG_MAX_LINES = 1000
+
+# Color de cada nivel de log
+LOG_TAGS = {
+    'INFO': THEME['accent'],
+    'WARNING': THEME['warning'],
+    'ERROR': THEME['error'],
+}
+
 class QueueHandler(logging.Handler):
     def __init__(self, log_queue):
         super().__init__()
         self.log_queue = log_queue
 
     def emit(self, record):
-        self.log_queue.put(record)
+        # Formatear aquí, en el hilo que registra, y no en el de la interfaz
+        try:
+            self.log_queue.put((record.levelname, self.format(record)))
+        except Exception:
+            self.handleError(record)
+
+class LogView:
+    """Log acotado sobre un widget Text que se actualiza por lotes.
+    
+    Las líneas pendientes se acumulan en un buffer circular de max_lines
+    líneas y se vuelcan en una sola inserción por ciclo; el widget conserva
+    solo las max_lines más recientes.
+    """
+
+    def __init__(self, text, max_lines=LOG_MAX_LINES):
+        self.text = text
+        self.max_lines = max_lines
+        self.pending = deque(maxlen=max_lines)
+        self.lines = 0
+        for tag, color in LOG_TAGS.items():
+            self.text.tag_config(tag, foreground=color)
+
+    def drain(self, log_queue):
+        """Pasa al buffer todo lo que haya en la cola."""
+        while True:
+            try:
+                self.pending.append(log_queue.get_nowait())
+            except queue.Empty:
+                return
+
+    def flush(self):
+        """Inserta las líneas pendientes y recorta las más antiguas."""
+        if not self.pending:
+            return
+        chunks = []
+        for level, message in self.pending:
+            chunks.extend([message + '\n', level if level in LOG_TAGS else ()])
+            self.lines += message.count('\n') + 1
+        self.pending.clear()
+        self.text.insert(tk.END, *chunks)
+        
+        excess = self.lines - self.max_lines
+        if excess > 0:
+            self.text.delete('1.0', f'{excess + 1}.0')
+            self.lines = self.max_lines
+        self.text.see(tk.END)
+
+    def clear(self):
+        self.pending.clear()
+        self.text.delete('1.0', tk.END)
+        self.lines = 0
 
 class MasterWGUI:
-    def __init__(self, root, processor):
+    def __init__(self, root, processor, startup_timer=None):
         # Variables base
         self.root = root
         self.processor = processor
         self.log_queue = queue.Queue()
+        self.log_view = None
+        self.pending_progress = None  # Último progreso, aplicado junto con el log
+        self.ui_calls = queue.Queue()  # Llamadas de hilos en segundo plano para el bucle principal
+        self.startup_timer = startup_timer  # Perfil de arranque (--profile-imports)
         
         # Variables de estado
         self.is_processing = False
+        self.worker = None
         self.target_file = None
         self.reference_file = None
+        self.preview_region = None  # Tramo (inicio, fin) en segundos elegido sobre la forma de onda
         self.last_directory = os.path.expanduser("~")
         
         # Inicialización del sistema
@@ -67,6 +160,9 @@ class MasterWGUI:
         # Crear interfaz
         self.create_gui()
         self.process_logs()
+        
+        # Los módulos pesados se cargan cuando la ventana ya está en pantalla
+        self.root.after(0, self.start_warm_up)
 
     def setup_logging(self):
         """Configura el sistema de logging."""
@@ -138,6 +234,15 @@ class MasterWGUI:
             foreground=THEME['bg_dark'],
             padding=(THEME['padding_large'], THEME['padding_medium']))
             
+        # Opciones (casillas junto a los botones)
+        style.configure('Option.TCheckbutton',
+            background=THEME['bg_dark'],
+            foreground=THEME['text'],
+            font=THEME['font_main'])
+        style.map('Option.TCheckbutton',
+            background=[('active', THEME['bg_dark'])],
+            foreground=[('disabled', THEME['text_secondary'])])
+            
         # Barra de progreso
         style.configure('Progress.Horizontal.TProgressbar',
             background=THEME['accent'],
@@ -265,26 +370,88 @@ class MasterWGUI:
         viz_frame.grid_columnconfigure(0, weight=1)
         viz_frame.grid_rowconfigure(0, weight=1)
         
-        # Configurar figura
-        self.figure = Figure(figsize=(8, 6), dpi=100, facecolor=THEME['bg_medium'])
-        self.canvas = FigureCanvasTkAgg(self.figure, master=viz_frame)
-        self.canvas.get_tk_widget().grid(row=0, column=0, sticky='nsew', padx=1, pady=1)
-        
-        # Configurar subplots con GridSpec
-        gs = self.figure.add_gridspec(2, 1, height_ratios=[1, 1], hspace=0.3)
-        self.waveform_ax = self.figure.add_subplot(gs[0])
-        self.spectrum_ax = self.figure.add_subplot(gs[1])
-        
-        # Configurar estilo inicial
-        self._setup_plot_style()
-        
-        # Ajustar márgenes
-        self.figure.subplots_adjust(
-            left=0.08,    # Margen izquierdo
-            right=0.92,   # Margen derecho
-            top=0.92,     # Margen superior
-            bottom=0.1    # Margen inferior
+        # La figura se crea cuando matplotlib termina de cargarse en segundo plano
+        self.viz_frame = viz_frame
+        self.figure = None
+        self.viz_placeholder = ttk.Label(
+            viz_frame,
+            text="Preparando visualización...",
+            style='Info.TLabel'
         )
+        self.viz_placeholder.grid(row=0, column=0)
+
+    def start_warm_up(self):
+        """Precarga matplotlib y los módulos de masterización en un hilo."""
+        threading.Thread(target=self._warm_up, daemon=True).start()
+
+    def _warm_up(self):
+        try:
+            with stage(self.startup_timer, 'import_matplotlib'):
+                import matplotlib.backends.backend_tkagg
+                import matplotlib.figure
+        except Exception as e:
+            self.logger.error(f"Error al cargar matplotlib: {str(e)}")
+        # Tk no admite llamadas desde este hilo (ni siquiera after si la ventana
+        # se cerró): el bucle principal las recoge en process_logs
+        self.ui_calls.put(self._create_figure)
+        
+        try:
+            self.processor.warm_up(self.startup_timer)
+        except Exception as e:
+            self.logger.warning(f"No se pudieron precargar los módulos de masterización: {str(e)}")
+        self.ui_calls.put(self._report_startup)
+
+    def _create_figure(self):
+        """Crea la figura de visualización (en el hilo de la interfaz)."""
+        if self.figure is not None or not self.root.winfo_exists():
+            return
+        
+        try:
+            with stage(self.startup_timer, 'visualization'):
+                from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+                from matplotlib.figure import Figure
+                
+                # Configurar figura
+                self.viz_placeholder.destroy()
+                self.figure = Figure(figsize=(8, 6), dpi=100, facecolor=THEME['bg_medium'])
+                self.canvas = FigureCanvasTkAgg(self.figure, master=self.viz_frame)
+                self.canvas.get_tk_widget().grid(row=0, column=0, sticky='nsew', padx=1, pady=1)
+                
+                # Configurar subplots con GridSpec
+                gs = self.figure.add_gridspec(2, 1, height_ratios=[1, 1], hspace=0.3)
+                self.waveform_ax = self.figure.add_subplot(gs[0])
+                self.spectrum_ax = self.figure.add_subplot(gs[1])
+                
+                # Configurar estilo inicial
+                self._setup_plot_style()
+                
+                # Ajustar márgenes
+                self.figure.subplots_adjust(
+                    left=0.08,    # Margen izquierdo
+                    right=0.92,   # Margen derecho
+                    top=0.92,     # Margen superior
+                    bottom=0.1    # Margen inferior
+                )
+                
+                # Decoraciones fijas y artistas persistentes de cada pista
+                self._init_plot_artists()
+                
+                # Pistas cargadas antes de que la figura estuviera lista
+                self.update_audio_display()
+        except Exception as e:
+            self.figure = None
+            self.logger.error(f"Error al crear la visualización: {str(e)}")
+
+    def _report_startup(self):
+        """Muestra y guarda el perfil de arranque, si se pidió."""
+        timer = self.startup_timer
+        if timer is None:
+            return
+        self.startup_timer = None
+        record = timer.stop()
+        for entry in record['stages']:
+            self.logger.info(f"Arranque - {entry['name']}: {entry['wall']:.3f} s")
+        self.processor.finish_timing(record)
 
     def create_bottom_section(self):
         """Crea la sección inferior con controles y log."""
@@ -307,11 +474,12 @@ class MasterWGUI:
             wrap=tk.WORD
         )
         self.log_text.grid(row=0, column=0, sticky='ew')
+        self.log_view = LogView(self.log_text)
         
         # Frame para controles
         controls = ttk.Frame(bottom_frame, style='Main.TFrame')
         controls.grid(row=1, column=0, sticky='ew')
-        controls.grid_columnconfigure(1, weight=1)
+        controls.grid_columnconfigure(2, weight=1)
         
         # Botón de proceso
         self.process_button = ttk.Button(
@@ -322,13 +490,43 @@ class MasterWGUI:
         )
         self.process_button.grid(row=0, column=0, padx=(0, THEME['padding_medium']))
         
+        # Botón de previsualización (tramo seleccionado o el más fuerte)
+        self.preview_button = ttk.Button(
+            controls,
+            text="Previsualizar",
+            style='Action.TButton',
+            command=self.preview_audio
+        )
+        self.preview_button.grid(row=0, column=1, padx=(0, THEME['padding_medium']))
+        
         # Barra de progreso
         self.progress = ttk.Progressbar(
             controls,
             mode='determinate',
             style='Progress.Horizontal.TProgressbar'
         )
-        self.progress.grid(row=0, column=1, sticky='ew', padx=THEME['padding_medium'])
+        self.progress.grid(row=0, column=2, sticky='ew', padx=THEME['padding_medium'])
+        
+        # Botón de cancelación (solo activo durante la masterización)
+        self.cancel_button = ttk.Button(
+            controls,
+            text="Cancelar",
+            style='Action.TButton',
+            command=self.cancel_processing
+        )
+        self.cancel_button.grid(row=0, column=3, padx=(0, THEME['padding_medium']))
+        self.cancel_button.state(['disabled'])
+        
+        # Respaldo en disco de las pistas (sesiones largas con poca RAM)
+        self.memmap_var = tk.BooleanVar(value=self.processor.use_memmap)
+        self.memmap_check = ttk.Checkbutton(
+            controls,
+            text="Audio en disco",
+            style='Option.TCheckbutton',
+            variable=self.memmap_var,
+            command=self.toggle_memmap
+        )
+        self.memmap_check.grid(row=0, column=4, padx=(0, THEME['padding_medium']))
         
         # Botón de guardado
         self.save_button = ttk.Button(
@@ -337,7 +535,15 @@ class MasterWGUI:
             style='Action.TButton',
             command=self.save_result
         )
-        self.save_button.grid(row=0, column=2)
+        self.save_button.grid(row=0, column=5)
+
+    def toggle_memmap(self):
+        """Activa o desactiva el respaldo en disco para las próximas cargas."""
+        self.processor.use_memmap = self.memmap_var.get()
+        if self.processor.use_memmap:
+            self.logger.info("Audio en disco: las próximas pistas se respaldarán en la carpeta de resultados")
+        else:
+            self.logger.info("Audio en memoria para las próximas pistas")
 
     def _setup_plot_style(self):
         """Configura el estilo de los gráficos."""
@@ -393,61 +599,9 @@ class MasterWGUI:
             fontsize=8
         )
 
-    def update_audio_display(self):
-        """Actualiza la visualización de audio."""
-        if not self.root.winfo_exists():
-            return
-
-        try:
-            self.waveform_ax.clear()
-            self.spectrum_ax.clear()
-            self._setup_plot_style()
-
-            # Colores para cada tipo de audio
-            colors = {
-                'target': {'color': '#00CC66', 'label': 'Original'},
-                'reference': {'color': '#FF6B6B', 'label': 'Referencia'},
-                'result': {'color': '#4ECDC4', 'label': 'Masterizado'}
-            }
-
-            # Dibujar las formas de onda
-            self._draw_waveforms(colors)
-            
-            # Dibujar los espectros
-            self._draw_spectrums(colors)
-
-            # Actualizar visualización
-            self.canvas.draw()
-
-        except Exception as e:
-            self.logger.error(f"Error al actualizar visualización: {str(e)}")
-
-    def _draw_waveforms(self, colors):
-        """Dibuja las formas de onda de todos los audios."""
-        max_duration = 0
-        
-        # Dibujar cada tipo de audio
-        audio_data = self._get_audio_data()
-        for audio_type, audio in audio_data.items():
-            if audio is not None and isinstance(audio, np.ndarray):  # Verificación adicional
-                time = np.arange(len(audio)) / self._get_sample_rate(audio_type)
-                max_duration = max(max_duration, time[-1])
-                
-                self.waveform_ax.plot(
-                    time, 
-                    audio,
-                    color=colors[audio_type]['color'],
-                    label=colors[audio_type]['label'],
-                    alpha=0.7,
-                    linewidth=0.5
-                )
-
-        # Configurar ejes
-        self.waveform_ax.set_ylim([-1.1, 1.1])
-        if max_duration > 0:  # Verificación adicional
-            self.waveform_ax.set_xlim([0, max_duration])
-        
-        # Añadir líneas de referencia
+    def _init_plot_artists(self):
+        """Crea una sola vez las decoraciones fijas y los artistas de cada pista."""
+        # Líneas de referencia de la forma de onda
         for level in [-1, -0.5, 0, 0.5, 1]:
             self.waveform_ax.axhline(
                 y=level,
@@ -455,66 +609,11 @@ class MasterWGUI:
                 linestyle=':',
                 alpha=0.3
             )
-
-        # Leyenda
-        if self.waveform_ax.get_legend_handles_labels()[0]:  # Verificar si hay elementos para la leyenda
-            legend = self.waveform_ax.legend(
-                loc='upper right',
-                fancybox=True,
-                framealpha=0.8,
-                fontsize=8
-            )
-            legend.get_frame().set_facecolor(THEME['bg_medium'])
-            for text in legend.get_texts():
-                text.set_color(THEME['text'])
-
-    def _draw_spectrums(self, colors):
-        """Dibuja los espectros de frecuencia de todos los audios."""
-        window_size = 8192
-        ref_max = -120
+        self.waveform_ax.set_ylim([-1.1, 1.1])
         
-        # Dibujar cada tipo de audio
-        audio_data = self._get_audio_data()
-        for audio_type, audio in audio_data.items():
-            if audio is not None and isinstance(audio, np.ndarray):  # Verificación adicional
-                # Calcular espectro
-                try:
-                    spectrum, freqs = self._calculate_spectrum(audio, window_size)
-                    magnitude_db = 20 * np.log10(np.maximum(spectrum, 1e-10))
-                    ref_max = max(ref_max, np.max(magnitude_db))
-                    
-                    # Dibujar espectro
-                    self.spectrum_ax.semilogx(
-                        freqs[1:],
-                        magnitude_db[1:],
-                        color=colors[audio_type]['color'],
-                        label=colors[audio_type]['label'],
-                        alpha=0.7,
-                        linewidth=0.8
-                    )
-                except Exception as e:
-                    self.logger.error(f"Error al calcular espectro para {audio_type}: {str(e)}")
-                    continue
-
-        # Configurar ejes
-        self.spectrum_ax.set_xlim([20, 20000])
-        self.spectrum_ax.set_ylim([ref_max - 60, ref_max + 5])
-        
-        # Añadir marcadores de frecuencia
-        freq_bands = {
-            '20Hz': 20,
-            '50Hz': 50,
-            '100Hz': 100,
-            '200Hz': 200,
-            '500Hz': 500,
-            '1kHz': 1000,
-            '2kHz': 2000,
-            '5kHz': 5000,
-            '10kHz': 10000,
-            '20kHz': 20000
-        }
-        
-        for label, freq in freq_bands.items():
+        # Marcadores de frecuencia (posición vertical relativa al eje)
+        label_transform = self.spectrum_ax.get_xaxis_transform()
+        for label, freq in FREQ_BANDS.items():
             self.spectrum_ax.axvline(
                 x=freq,
                 color=THEME['bg_light'],
@@ -524,16 +623,17 @@ class MasterWGUI:
             if freq in [100, 1000, 10000]:
                 self.spectrum_ax.text(
                     freq,
-                    ref_max - 55,
+                    0.08,
                     label,
+                    transform=label_transform,
                     color=THEME['text_secondary'],
                     ha='center',
                     va='top',
                     fontsize=7
                 )
-
-        # Añadir líneas de referencia de dB
-        for db in range(int(ref_max - 60), int(ref_max + 5), 12):
+        
+        # Líneas de referencia de dB; las que quedan fuera del eje se recortan
+        for db in range(-144, 61, 12):
             self.spectrum_ax.axhline(
                 y=db,
                 color=THEME['bg_light'],
@@ -546,12 +646,126 @@ class MasterWGUI:
                 f'{db}dB',
                 color=THEME['text_secondary'],
                 va='center',
-                fontsize=7
+                fontsize=7,
+                clip_on=True
+            )
+        self.spectrum_ax.set_xscale('log')
+        self.spectrum_ax.set_xlim([20, 20000])
+        self.spectrum_ax.set_ylim([-180, -115])
+        
+        # Artistas de cada pista: se actualizan sus datos, nunca se recrea el eje
+        self.waveform_artists = {}
+        self.spectrum_artists = {}
+        for audio_type, style in TRACK_STYLES.items():
+            line, = self.spectrum_ax.plot(
+                [],
+                [],
+                color=style['color'],
+                label=style['label'],
+                alpha=0.7,
+                linewidth=0.8,
+                animated=True,
+                visible=False
             )
+            self.spectrum_artists[audio_type] = line
+        
+        # Selección del tramo a previsualizar arrastrando sobre la forma de onda
+        from matplotlib.widgets import SpanSelector
+        self.region_selector = SpanSelector(
+            self.waveform_ax,
+            self._on_region_selected,
+            'horizontal',
+            useblit=False,
+            interactive=True,
+            props={'facecolor': THEME['accent'], 'alpha': 0.15}
+        )
+        
+        self.plot_background = None
+        self.legend_types = ()
+        self.canvas.mpl_connect('draw_event', self._on_canvas_draw)
+
+    def _on_region_selected(self, start, end):
+        """Guarda el tramo elegido; un clic sin arrastrar vuelve al tramo automático."""
+        if end - start < MIN_PREVIEW_SECONDS:
+            self.preview_region = None
+            self.logger.info(f"Se previsualizarán los {PREVIEW_SECONDS} s más fuertes")
+        else:
+            self.preview_region = (max(0.0, start), end)
+            self.logger.info(f"Tramo a previsualizar: {self.preview_region[0]:.1f} s - {end:.1f} s")
+
+    def _clear_preview_region(self):
+        """Descarta el tramo elegido (p. ej. al cambiar de audio original)."""
+        self.preview_region = None
+        if self.figure is not None:
+            self.region_selector.clear()
+
+    def _on_canvas_draw(self, event):
+        """Guarda el fondo estático tras un redibujado completo."""
+        self.plot_background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_track_artists()
+
+    def _draw_track_artists(self):
+        """Dibuja solo los artistas de las pistas sobre el fondo actual."""
+        for artist in [*self.waveform_artists.values(), *self.spectrum_artists.values()]:
+            if artist.get_visible():
+                artist.axes.draw_artist(artist)
+        
+        # Las leyendas van encima de las pistas
+        for ax in [self.waveform_ax, self.spectrum_ax]:
+            if ax.get_legend():
+                ax.draw_artist(ax.get_legend())
+
+    def update_audio_display(self, audio_type=None):
+        """Actualiza la visualización de audio.
+        
+        Si se indica audio_type, solo se actualizan los datos de esa pista. Las
+        decoraciones fijas se reutilizan y, si los límites de los ejes no
+        cambian, el resultado se pinta por blitting sobre el fondo guardado.
+        """
+        if self.figure is None or not self.root.winfo_exists():
+            return
+
+        try:
+            audio_types = [audio_type] if audio_type else list(TRACK_STYLES)
+            
+            # Dibujar las formas de onda
+            waveform_changed = self._draw_waveforms(TRACK_STYLES, audio_types)
+            
+            # Dibujar los espectros
+            spectrum_changed = self._draw_spectrums(TRACK_STYLES, audio_types)
+            
+            legend_changed = self._update_legends()
+
+            # Actualizar visualización
+            if waveform_changed or spectrum_changed or legend_changed or self.plot_background is None:
+                self.canvas.draw()
+            else:
+                self.canvas.restore_region(self.plot_background)
+                self._draw_track_artists()
+                self.canvas.blit(self.figure.bbox)
 
-        # Leyenda
-        if self.spectrum_ax.get_legend_handles_labels()[0]:  # Verificar si hay elementos para la leyenda
-            legend = self.spectrum_ax.legend(
+        except Exception as e:
+            self.logger.error(f"Error al actualizar visualización: {str(e)}")
+
+    def _update_legends(self):
+        """Recrea las leyendas solo si cambian las pistas visibles."""
+        visible_types = tuple(
+            audio_type for audio_type, line in self.spectrum_artists.items()
+            if line.get_visible()
+        )
+        if visible_types == self.legend_types:
+            return False
+        self.legend_types = visible_types
+        
+        for ax, artists in [(self.waveform_ax, self.waveform_artists),
+                            (self.spectrum_ax, self.spectrum_artists)]:
+            handles = [artists[t] for t in visible_types if t in artists]
+            if ax.get_legend():
+                ax.get_legend().remove()
+            if not handles:
+                continue
+            legend = ax.legend(
+                handles=handles,
                 loc='upper right',
                 fancybox=True,
                 framealpha=0.8,
@@ -560,79 +774,104 @@ class MasterWGUI:
             legend.get_frame().set_facecolor(THEME['bg_medium'])
             for text in legend.get_texts():
                 text.set_color(THEME['text'])
+            legend.set_animated(True)
+        return True
 
-    def _calculate_spectrum(self, audio_data, window_size):
-        """Calcula el espectro de frecuencias usando ventana Hann."""
-        try:
-            window = np.hanning(window_size)
-            hop_size = window_size // 2
-            
-            # Calcular número de segmentos
-            num_segments = (len(audio_data) - window_size) // hop_size + 1
-            
-            # Inicializar array para el espectro
-            spectrum = np.zeros(window_size // 2 + 1)
-            
-            # Calcular FFT por segmentos y promediar
-            for i in range(num_segments):
-                start = i * hop_size
-                segment = audio_data[start:start + window_size]
-                if len(segment) == window_size:
-                    fft = np.fft.rfft(segment * window)
-                    spectrum += np.abs(fft)
-            
-            spectrum /= max(num_segments, 1)  # Evitar división por cero
-            freqs = np.fft.rfftfreq(window_size, 1/self.processor.sample_rate)
+    def _draw_waveforms(self, colors, audio_types=None):
+        """Actualiza las formas de onda. Devuelve True si cambiaron los límites."""
+        # Una columna de la envolvente por cada píxel del eje
+        num_bins = max(int(self.waveform_ax.bbox.width), 100)
+        
+        for audio_type in audio_types or colors:
+            old_artist = self.waveform_artists.pop(audio_type, None)
+            if old_artist is not None:
+                old_artist.remove()
             
-            return spectrum, freqs
+            overview = self._get_overview(audio_type)
+            if overview is None or overview.length == 0:
+                continue
             
-        except Exception as e:
-            self.logger.error(f"Error en cálculo de espectro: {str(e)}")
-            raise
+            # Envolvente a partir del resumen precalculado
+            time, mins, maxs = overview.envelope(num_bins)
+            self.waveform_artists[audio_type] = self.waveform_ax.fill_between(
+                time,
+                mins,
+                maxs,
+                color=colors[audio_type]['color'],
+                label=colors[audio_type]['label'],
+                alpha=0.7,
+                linewidth=0,
+                animated=True
+            )
 
-    def _get_audio_data(self):
-        """Obtiene los datos de audio normalizados para visualización."""
-        audio_data = {}
+        # Configurar ejes según la pista más larga
+        max_duration = 0
+        for audio_type in colors:
+            overview = self._get_overview(audio_type)
+            if overview is not None:
+                max_duration = max(max_duration, overview.end_time)
         
-        try:
-            # Procesar audio objetivo
-            if self.processor.target_audio is not None:
-                audio_data['target'] = self._normalize_audio(self.processor.target_audio)
-                
-            # Procesar audio de referencia
-            if self.processor.reference_audio is not None:
-                audio_data['reference'] = self._normalize_audio(self.processor.reference_audio)
-                
-            # Procesar resultado
-            if self.processor.result_audio is not None:
-                audio_data['result'] = self._normalize_audio(self.processor.result_audio)
-                
-        except Exception as e:
-            self.logger.error(f"Error al obtener datos de audio: {str(e)}")
+        if max_duration > 0 and tuple(self.waveform_ax.get_xlim()) != (0, max_duration):
+            self.waveform_ax.set_xlim([0, max_duration])
+            return True
+        return False
+
+    def _draw_spectrums(self, colors, audio_types=None):
+        """Actualiza los espectros. Devuelve True si cambiaron los límites."""
+        for audio_type in audio_types or colors:
+            line = self.spectrum_artists[audio_type]
+            overview = self._get_overview(audio_type)
+            if overview is None:
+                line.set_visible(False)
+                continue
             
-        return audio_data
+            try:
+                magnitude_db = 20 * np.log10(np.maximum(overview.spectrum, 1e-10))
+                line.set_data(overview.freqs[1:], magnitude_db[1:])
+                line.set_visible(True)
+            except Exception as e:
+                self.logger.error(f"Error al dibujar espectro para {audio_type}: {str(e)}")
+                line.set_visible(False)
+
+        # Configurar ejes según el máximo de los espectros visibles
+        ref_max = -120
+        for line in self.spectrum_artists.values():
+            if line.get_visible() and len(line.get_ydata()):
+                ref_max = max(ref_max, np.max(line.get_ydata()))
+        
+        ylim = (ref_max - 60, ref_max + 5)
+        if tuple(self.spectrum_ax.get_ylim()) != ylim:
+            self.spectrum_ax.set_ylim(ylim)
+            return True
+        return False
+
+    def _show_saved_overview(self, audio_type):
+        """Dibuja el resumen guardado de una pista mientras aún se decodifica.
+        
+        Se llama desde el hilo de carga: el dibujo se hace en el bucle principal.
+        """
+        self.ui_calls.put(lambda: self.update_audio_display(audio_type))
 
-    def _normalize_audio(self, audio):
-        """Normaliza el audio para visualización."""
+    def _get_overview(self, audio_type):
+        """Obtiene el resumen de visualización, calculándolo si aún no existe.
+        
+        Un resumen guardado puede estar disponible antes que el audio.
+        """
+        overview = getattr(self.processor, f'{audio_type}_overview', None)
+        if overview is not None:
+            return overview
+        
+        audio = getattr(self.processor, f'{audio_type}_audio', None)
+        if audio is None or not isinstance(audio, np.ndarray) or audio.size == 0:
+            return None
+        
         try:
-            # Verificar que el audio es un array válido
-            if not isinstance(audio, np.ndarray):
-                return None
-                
-            # Convertir a mono si es estéreo
-            if len(audio.shape) > 1:
-                audio = np.mean(audio, axis=1)
-                
-            # Normalizar a [-1, 1]
-            max_val = np.max(np.abs(audio))
-            if max_val > 0:
-                audio = audio / max_val
-                
-            return audio
-            
+            overview = build_overview(audio, self._get_sample_rate(audio_type))
+            setattr(self.processor, f'{audio_type}_overview', overview)
         except Exception as e:
-            self.logger.error(f"Error al normalizar audio: {str(e)}")
+            self.logger.error(f"Error al calcular resumen de {audio_type}: {str(e)}")
             return None
+        return overview
 
     def _get_sample_rate(self, audio_type):
         """Obtiene el sample rate del tipo de audio especificado."""
@@ -648,31 +887,29 @@ class MasterWGUI:
             return 44100  # Valor por defecto
 
     def process_logs(self):
-        """Procesa los mensajes de log en cola."""
+        """Vuelca el log y el progreso pendientes, una vez por ciclo.
+        
+        También ejecuta las llamadas que los hilos en segundo plano dejan en
+        ui_calls.
+        """
         if not self.root.winfo_exists():
             return
             
         try:
             while True:
                 try:
-                    record = self.log_queue.get_nowait()
-                    msg = self.log_formatter.format(record)
-                    self.log_text.insert(tk.END, msg + '\n')
-                    
-                    # Aplicar colores según el tipo de mensaje
-                    if record.levelname == "WARNING":
-                        self.log_text.tag_add("warning", "end-2c linestart", "end-1c")
-                        self.log_text.tag_config("warning", foreground=THEME['warning'])
-                    elif record.levelname == "ERROR":
-                        self.log_text.tag_add("error", "end-2c linestart", "end-1c")
-                        self.log_text.tag_config("error", foreground=THEME['error'])
-                    elif record.levelname == "INFO":
-                        self.log_text.tag_add("info", "end-2c linestart", "end-1c")
-                        self.log_text.tag_config("info", foreground=THEME['accent'])
-                    
-                    self.log_text.see(tk.END)
+                    callback = self.ui_calls.get_nowait()
                 except queue.Empty:
                     break
+                callback()
+            
+            self.log_view.drain(self.log_queue)
+            self.log_view.flush()
+            
+            # Solo cuenta el último progreso recibido desde el ciclo anterior
+            progress, self.pending_progress = self.pending_progress, None
+            if progress is not None:
+                self.progress['value'] = progress
         except tk.TclError:
             return
             
@@ -680,10 +917,12 @@ class MasterWGUI:
             self.root.after(100, self.process_logs)
 
     def update_progress(self, value):
-        """Actualiza la barra de progreso."""
-        if self.root.winfo_exists():
-            self.progress['value'] = value
-            self.root.update_idletasks()
+        """Actualiza la barra de progreso en el siguiente ciclo del log.
+        
+        Puede llamarse desde cualquier hilo; las actualizaciones intermedias
+        se descartan.
+        """
+        self.pending_progress = value
 
     def update_file_info(self, file_type):
         """Actualiza la información del archivo."""
@@ -695,8 +934,19 @@ class MasterWGUI:
                     f"Canales: {info['channels']}\n"
                     f"Duración: {info['duration']:.2f} s\n"
                     f"Peak: {info['peak']:.1f} dB\n"
-                    f"RMS: {info['rms']:.1f} dB"
+                    f"RMS: {info['rms']:.1f} dB\n"
+                    f"Cresta: {info['crest']:.1f} dB\n"
+                    f"Muestras recortadas: {info['clipped']}"
                 )
+                loudness = info.get('loudness')
+                if loudness:
+                    info_text += (
+                        f"\nLoudness: {loudness['integrated']:.1f} LUFS\n"
+                        f"Corto plazo máx.: {loudness['short_term_max']:.1f} LUFS\n"
+                        f"Momentáneo máx.: {loudness['momentary_max']:.1f} LUFS\n"
+                        f"LRA: {loudness['loudness_range']:.1f} LU\n"
+                        f"True peak: {loudness['true_peak']:.1f} dBTP"
+                    )
                 
                 if file_type == 'target':
                     self.target_info.configure(text=info_text)
@@ -706,7 +956,7 @@ class MasterWGUI:
             self.logger.error(f"Error al actualizar información del archivo: {str(e)}")
 
     def process_audio(self):
-        """Procesa el audio usando matchering."""
+        """Procesa el audio usando matchering en un proceso aparte."""
         if not self.target_file or not self.reference_file:
             self._show_error(
                 "Error",
@@ -719,65 +969,140 @@ class MasterWGUI:
         
         self.is_processing = True
         self.disable_controls()
-        self.progress['value'] = 0
+        self.update_progress(0)
         
         # Limpiar el log
-        self.log_text.delete(1.0, tk.END)
+        self.log_view.clear()
+        self._start_worker()
+
+    def _start_worker(self, region=None):
+        """Lanza la masterización (o la de un tramo, con 'region') en otro proceso.
         
-        def process_thread():
-            try:
-                processing_success = self.processor.process_audio(self.update_progress)
-                
-                def update_gui():
-                    try:
-                        # Verificar el procesamiento y el resultado
-                        has_result = (hasattr(self.processor, 'result_audio') and 
-                                    self.processor.result_audio is not None and 
-                                    isinstance(self.processor.result_audio, np.ndarray) and 
-                                    self.processor.result_audio.size > 0)
-                        
-                        if processing_success and has_result:
-                            try:
-                                self.update_audio_display()
-                                self._show_success(
-                                    "Masterización Completada",
-                                    "El proceso de masterización ha finalizado exitosamente.\n"
-                                    "Puede guardar el resultado cuando lo desee."
-                                )
-                            except Exception as visual_error:
-                                self.logger.error(f"Error en visualización: {str(visual_error)}")
-                                self._show_error(
-                                    "Error de Visualización",
-                                    "La masterización se completó pero hubo un error al mostrar el resultado.\n"
-                                    "El archivo aún puede ser guardado correctamente."
-                                )
-                        else:
-                            self._show_error(
-                                "Error de Procesamiento",
-                                "Ocurrió un error durante el proceso de masterización.\n"
-                                "Revise el log para más detalles."
-                            )
-                    except Exception as gui_error:
-                        self.logger.error(f"Error en actualización de GUI: {str(gui_error)}")
-                    finally:
-                        self.enable_controls()
-                        self.is_processing = False
-                
-                self.root.after(0, update_gui)
-                
-            except Exception as e:
-                self.logger.error(f"Error inesperado en procesamiento: {str(e)}")
-                def show_error():
-                    self._show_error(
-                        "Error Inesperado",
-                        "Ocurrió un error durante la masterización.\n"
-                        "Revise el log para más detalles."
-                    )
-                    self.enable_controls()
-                    self.is_processing = False
-                self.root.after(0, show_error)
+        Aquí solo se recogen sus eventos, desde el bucle principal.
+        """
+        try:
+            self.worker = MasteringWorker(self.processor, region)
+            self.worker.start()
+        except Exception as e:
+            self.logger.error(f"No se pudo iniciar el proceso de masterización: {str(e)}")
+            self._finish_processing()
+            self._show_error(
+                "Error Inesperado",
+                "No se pudo iniciar la masterización.\n"
+                "Revise el log para más detalles."
+            )
+            return
+        
+        self.cancel_button.state(['!disabled'])
+        self.root.after(50, self._poll_worker)
+
+    def preview_audio(self):
+        """Masteriza solo el tramo elegido (o el más fuerte) para escucharlo rápido."""
+        if not self.target_file or not self.reference_file:
+            self._show_error(
+                "Error",
+                "Debe cargar tanto el audio original como el de referencia"
+            )
+            return
+        
+        if self.is_processing:
+            return
         
-        threading.Thread(target=process_thread, daemon=True).start()
+        self.is_processing = True
+        self.disable_controls()
+        self.update_progress(0)
+        
+        # Mismo proceso cancelable que la masterización completa, solo con el tramo
+        try:
+            region = self.processor.preview_bounds(self.preview_region)
+        except Exception as e:
+            self.logger.error(f"No se pudo elegir el tramo a previsualizar: {str(e)}")
+            self.enable_controls()
+            self.is_processing = False
+            return
+        self._start_worker(region)
+
+    def _poll_worker(self):
+        """Atiende los eventos del proceso de masterización."""
+        if self.worker is None or not self.root.winfo_exists():
+            return
+        
+        for event in self.worker.poll():
+            kind = event[0]
+            if kind == 'progress':
+                self.update_progress(event[1])
+            elif kind == 'done':
+                preview = self.worker.region is not None
+                self._finish_processing()
+                self.update_progress(100)
+                if preview:
+                    self.logger.info("Previsualización completada")
+                    self.update_audio_display('result')
+                else:
+                    self._on_processing_done()
+                return
+            elif kind == 'cancelled':
+                self._finish_processing()
+                self.update_progress(0)
+                self.logger.warning("Masterización cancelada")
+                return
+            elif kind == 'error':
+                self._finish_processing()
+                self._show_error(
+                    "Error de Procesamiento",
+                    "Ocurrió un error durante el proceso de masterización.\n"
+                    "Revise el log para más detalles."
+                )
+                return
+        
+        self.root.after(50, self._poll_worker)
+
+    def _on_processing_done(self):
+        """Muestra el resultado recibido del proceso de masterización."""
+        loudness = self.processor.get_loudness('result')
+        if loudness:
+            self.logger.info(
+                f"Resultado: {loudness['integrated']:.1f} LUFS, "
+                f"LRA {loudness['loudness_range']:.1f} LU, "
+                f"true peak {loudness['true_peak']:.1f} dBTP"
+            )
+        try:
+            self.update_audio_display('result')
+            self._show_success(
+                "Masterización Completada",
+                "El proceso de masterización ha finalizado exitosamente.\n"
+                "Puede guardar el resultado cuando lo desee."
+            )
+        except Exception as visual_error:
+            self.logger.error(f"Error en visualización: {str(visual_error)}")
+            self._show_error(
+                "Error de Visualización",
+                "La masterización se completó pero hubo un error al mostrar el resultado.\n"
+                "El archivo aún puede ser guardado correctamente."
+            )
+
+    def _finish_processing(self):
+        """Libera el proceso de masterización y reactiva los controles."""
+        self.stop_worker()
+        self.cancel_button.state(['disabled'])
+        self.enable_controls()
+        self.is_processing = False
+
+    def cancel_processing(self):
+        """Cancela la masterización en curso sin cerrar la aplicación."""
+        if self.worker is not None:
+            self.logger.warning("Cancelando masterización...")
+            self.cancel_button.state(['disabled'])
+            self.worker.cancel()
+
+    def stop_worker(self):
+        """Termina el proceso de masterización, si hay uno en marcha."""
+        if self.worker is not None:
+            worker = self.worker
+            self.worker = None
+            if not worker.finished:
+                worker.cancel()
+            worker.close()
 
     def load_target(self):
         """Carga el archivo de audio objetivo."""
@@ -804,10 +1129,14 @@ class MasterWGUI:
                 
                 def load_thread():
                     try:
-                        if self.processor.load_target(file_path):
+                        if self.processor.load_target(file_path, self._show_saved_overview):
                             self.target_file = file_path
+                            # Medir loudness aquí para no bloquear la interfaz
+                            self.processor.get_loudness('target')
+                            self._log_suggestions()
+                            self.root.after(0, self._clear_preview_region)
                             self.root.after(0, lambda: self.update_file_info('target'))
-                            self.root.after(0, self.update_audio_display)
+                            self.root.after(0, lambda: self.update_audio_display('target'))
                         else:
                             self.root.after(0, lambda: self._show_error(
                                 "Error al cargar archivo",
@@ -832,6 +1161,13 @@ class MasterWGUI:
                 "No se pudo abrir el diálogo de selección de archivo."
             )
 
+    def _log_suggestions(self):
+        """Muestra en el log las referencias de la biblioteca más parecidas al original."""
+        suggestions = self.processor.suggest_references()
+        if suggestions:
+            names = ", ".join(os.path.basename(path) for path, _ in suggestions)
+            self.logger.info(f"Referencias sugeridas: {names}")
+
     def load_reference(self):
         """Carga el archivo de audio de referencia."""
         file_types = [
@@ -857,10 +1193,11 @@ class MasterWGUI:
                 
                 def load_thread():
                     try:
-                        if self.processor.load_reference(file_path):
+                        if self.processor.load_reference(file_path, self._show_saved_overview):
                             self.reference_file = file_path
+                            self.processor.get_loudness('reference')
                             self.root.after(0, lambda: self.update_file_info('reference'))
-                            self.root.after(0, self.update_audio_display)
+                            self.root.after(0, lambda: self.update_audio_display('reference'))
                         else:
                             self.root.after(0, lambda: self._show_error(
                                 "Error al cargar archivo",
@@ -895,25 +1232,41 @@ class MasterWGUI:
             )
             return
         
+        if self.processor.result_preview is not None:
+            self._show_error(
+                "Previsualización",
+                "El resultado actual es solo una previsualización de un tramo.\n"
+                "Masterice la pista completa para guardarla."
+            )
+            return
+        
         try:
             # Generar nombre por defecto
             default_name = self._generate_output_filename()
             
+            # Un filtro por formato; el elegido determina cómo se codifica
+            formats = [DEFAULT_FORMAT] + [name for name in EXPORT_FORMATS if name != DEFAULT_FORMAT]
+            format_var = tk.StringVar(value=EXPORT_FORMATS[DEFAULT_FORMAT]['label'])
             file_path = filedialog.asksaveasfilename(
                 title="Guardar audio masterizado",
                 defaultextension=".wav",
                 initialfile=default_name,
-                filetypes=[("Archivo WAV", "*.wav")],
+                filetypes=[
+                    (EXPORT_FORMATS[name]['label'], f"*{EXPORT_FORMATS[name]['extension']}")
+                    for name in formats
+                ],
+                typevariable=format_var,
                 initialdir=self._get_last_directory()
             )
             
             if file_path:
                 self._save_last_directory(file_path)
                 self.disable_controls()
+                destination = {'path': file_path, 'format': self._export_format(file_path, format_var.get())}
                 
                 def save_thread():
                     try:
-                        if self.processor.save_result(file_path):
+                        if self.processor.save_result(destination):
                             self.logger.info(f"Resultado guardado en: {file_path}")
                             self.root.after(0, lambda: self._show_success(
                                 "Guardado Exitoso",
@@ -943,6 +1296,13 @@ class MasterWGUI:
                 "No se pudo abrir el diálogo de guardado de archivo."
             )
 
+    def _export_format(self, file_path, label):
+        """Formato elegido en el diálogo, salvo que la extensión indique otro."""
+        for name, spec in EXPORT_FORMATS.items():
+            if spec['label'] == label and os.path.splitext(file_path)[1].lower() == spec['extension']:
+                return name
+        return format_for_path(file_path)
+
     def _generate_output_filename(self):
         """Genera un nombre para el archivo de salida."""
         try:
@@ -977,13 +1337,15 @@ class MasterWGUI:
     def disable_controls(self):
         """Deshabilita los controles durante el procesamiento."""
         for widget in [self.load_target_btn, self.load_reference_btn,
-                      self.process_button, self.save_button]:
+                      self.process_button, self.preview_button, self.save_button,
+                      self.memmap_check]:
             if hasattr(widget, 'state'):
                 widget.state(['disabled'])
 
     def enable_controls(self):
         """Habilita los controles después del procesamiento."""
         for widget in [self.load_target_btn, self.load_reference_btn,
-                      self.process_button, self.save_button]:
+                      self.process_button, self.preview_button, self.save_button,
+                      self.memmap_check]:
             if hasattr(widget, 'state'):
                 widget.state(['!disabled'])
\ No newline at end of file
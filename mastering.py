@@ -0,0 +1,430 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import numpy as np
+import matchering as mg
+from scipy import signal, interpolate
+from matchering.checker import check, check_equality
+from matchering.dsp import channel_count, size, amplify, clip, ms_to_lr, rms, smooth_lowess
+from matchering.log import Code, ModuleError, info, debug, debug_line, warning
+from matchering.stage_helpers import (
+    normalize_reference,
+    analyze_levels,
+    get_lpis_and_match_rms,
+)
+from matchering.utils import to_db
+from limiter import StreamingLimiter
+from resampler import resample
+from timing import stage
+
+# Versión de los perfiles de referencia guardados en disco: cambiarla invalida
+# los anteriores (2: remuestreo polifásico propio en lugar del de matchering)
+PROFILE_VERSION = 2
+
+
+def to_2d(audio):
+    """Devuelve el audio con forma (muestras, canales) sin copiar datos."""
+    if audio.ndim == 1:
+        return audio.reshape(-1, 1)
+    return audio
+
+
+def profile_key(content_hash, config):
+    """Clave del perfil de referencia: contenido más parámetros de análisis."""
+    params = {
+        'version': PROFILE_VERSION,
+        'internal_sample_rate': config.internal_sample_rate,
+        'max_piece_size': config.max_piece_size,
+        'threshold': config.threshold,
+        'min_value': config.min_value,
+        'fft_size': config.fft_size,
+    }
+    payload = content_hash + json.dumps(params, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def save_profile(file_path, profile):
+    """Guarda un perfil de referencia como .npz de forma atómica.
+
+    El temporal tiene un nombre único: varios procesos pueden guardar el
+    mismo perfil a la vez sin pisarse.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or '.', suffix='.npz')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **profile)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def load_profile(file_path):
+    """Carga un perfil de referencia guardado con save_profile."""
+    with np.load(file_path) as data:
+        return {
+            'final_amplitude_coefficient': float(data['final_amplitude_coefficient']),
+            'match_rms': float(data['match_rms']),
+            'mid_fft': data['mid_fft'],
+            'side_fft': data['side_fft'],
+        }
+
+
+def resample_to_internal(audio, sample_rate, config, name):
+    """Remuestrea un audio al sample rate interno de matchering.
+
+    Usa el remuestreo polifásico con filtros en caché en lugar del de
+    matchering (resampy), mucho más lento.
+    """
+    if sample_rate == config.internal_sample_rate:
+        return audio
+    debug(f"Resampling {name.upper()} audio from {sample_rate} Hz to {config.internal_sample_rate} Hz...")
+    audio = resample(to_2d(audio), sample_rate, config.internal_sample_rate)
+    if name.upper() == "TARGET":
+        warning(Code.WARNING_TARGET_IS_RESAMPLED)
+    else:
+        info(Code.INFO_REFERENCE_IS_RESAMPLED)
+    return audio
+
+
+def _prepare(audio, sample_rate, config, name):
+    """Comprueba y adapta un audio (canales, sample rate) como hace matchering."""
+    audio = resample_to_internal(audio, sample_rate, config, name)
+    audio, sample_rate = check(to_2d(audio), config.internal_sample_rate, config, name)
+    if (
+        sample_rate != config.internal_sample_rate
+        or channel_count(audio) != 2
+        or size(audio) <= config.fft_size
+    ):
+        raise ModuleError(Code.ERROR_VALIDATION)
+    return audio
+
+
+def _average_fft(loudest_pieces, config):
+    """Espectro medio de magnitud de las partes más fuertes."""
+    *_, specs = signal.stft(
+        loudest_pieces,
+        config.internal_sample_rate,
+        window="boxcar",
+        nperseg=config.fft_size,
+        noverlap=0,
+        boundary=None,
+        padded=False,
+    )
+    return np.abs(specs).mean((0, 2))
+
+
+def _smooth_exponentially(matching_fft, config):
+    """Suaviza la curva de matching sobre una rejilla logarítmica."""
+    nyquist = config.internal_sample_rate * 0.5
+    grid_linear = nyquist * np.linspace(0, 1, config.fft_size // 2 + 1)
+    grid_logarithmic = nyquist * np.logspace(
+        np.log10(4 / config.fft_size),
+        0,
+        (config.fft_size // 2) * config.lin_log_oversampling + 1,
+    )
+
+    matching_fft_log = interpolate.interp1d(grid_linear, matching_fft, "cubic")(
+        grid_logarithmic
+    )
+    matching_fft_log = smooth_lowess(
+        matching_fft_log, config.lowess_frac, config.lowess_it, config.lowess_delta
+    )
+    smoothed = interpolate.interp1d(
+        grid_logarithmic, matching_fft_log, "cubic", fill_value="extrapolate"
+    )(grid_linear)
+
+    smoothed[0] = 0
+    smoothed[1] = matching_fft[1]
+    return smoothed
+
+
+def _get_fir(target_fft, reference_fft, name, config):
+    """Calcula el FIR del EQ de matching a partir de los espectros medios."""
+    debug(f"Calculating the {name} FIR for the matching EQ...")
+    matching_fft = reference_fft / np.maximum(config.min_value, target_fft)
+    fir = np.fft.irfft(_smooth_exponentially(matching_fft, config))
+    return np.fft.ifftshift(fir) * signal.windows.hann(len(fir))
+
+
+def analyze_reference(reference, reference_sr, config=None):
+    """Analiza la referencia y devuelve su perfil reutilizable.
+
+    El perfil contiene todo lo que matchering necesita de la referencia:
+    el coeficiente de amplitud final, el RMS de comparación y los espectros
+    medios de mid y side de sus partes más fuertes.
+    """
+    if config is None:
+        config = mg.Config()
+
+    reference = _prepare(reference, reference_sr, config, "reference")
+    reference, final_amplitude_coefficient = normalize_reference(reference, config)
+
+    _, _, mid_loudest_pieces, side_loudest_pieces, match_rms, *_ = analyze_levels(
+        reference, "reference", config
+    )
+
+    return {
+        'final_amplitude_coefficient': float(final_amplitude_coefficient),
+        'match_rms': float(match_rms),
+        'mid_fft': _average_fft(mid_loudest_pieces, config),
+        'side_fft': _average_fft(side_loudest_pieces, config),
+    }
+
+
+def count_max_peaks(audio, block_size=1 << 18):
+    """Valor absoluto máximo y número de muestras que lo alcanzan.
+
+    Equivale a matchering.dsp.count_max_peaks, pero recorre el audio por
+    bloques en lugar de crear varias copias del tamaño de la pista.
+    """
+    max_value = 0.0
+    for start in range(0, len(audio), block_size):
+        block = audio[start:start + block_size]
+        max_value = max(max_value, float(block.max()), -float(block.min()))
+
+    # La misma tolerancia que np.isclose
+    tolerance = 1e-8 + 1e-5 * max_value
+    max_count = 0
+    for start in range(0, len(audio), block_size):
+        block = np.abs(audio[start:start + block_size])
+        max_count += np.count_nonzero(np.abs(block - max_value) <= tolerance)
+    return max_value, max_count
+
+
+def check_clipping_limiting(target, config):
+    """Avisa si el objetivo está recortado o ya lleva un limitador, como matchering."""
+    max_value, max_count = count_max_peaks(target)
+    # matchering cuenta los archivos mono ya convertidos a estéreo
+    if channel_count(target) == 1:
+        max_count *= 2
+    if max_count <= config.clipping_samples_threshold:
+        return
+
+    logger = logging.getLogger('MasterW')
+    if np.isclose(max_value, 1.0):
+        logger.warning(f"Se detecta clipping en el audio objetivo ({max_count} muestras en el pico). "
+                       f"Es muy recomendable usar una versión sin recortes")
+    elif max_count > config.limited_samples_threshold:
+        logger.warning(f"Se detecta un limitador aplicado en el audio objetivo ({max_count} muestras en el pico). "
+                       f"Es muy recomendable usar una versión sin limitador")
+
+
+def prepare_target(target, target_sr, config=None):
+    """Adapta el audio objetivo para el procesado por bloques.
+
+    Solo copia el audio si hay que remuestrearlo; los archivos mono se
+    procesan tal cual (mid = L, side = 0) sin duplicar el canal. Como
+    mg.process, avisa si el objetivo llega recortado o limitado.
+    """
+    if config is None:
+        config = mg.Config()
+
+    target = to_2d(target)
+    if channel_count(target) > 2:
+        raise ModuleError(Code.ERROR_TARGET_NUM_OF_CHANNELS_IS_EXCEEDED)
+
+    target = resample_to_internal(target, target_sr, config, "target")
+
+    length = size(target)
+    debug(f"TARGET audio length: {length} samples")
+    if length > config.max_length * config.internal_sample_rate:
+        raise ModuleError(Code.ERROR_TARGET_LENGTH_IS_EXCEEDED)
+    if length <= config.fft_size:
+        raise ModuleError(Code.ERROR_TARGET_LENGTH_IS_TOO_SMALL)
+
+    check_clipping_limiting(target, config)
+    return target
+
+
+def _mid_side(target, start, end):
+    """Canales mid y side (float64) de un tramo del audio."""
+    block = np.asarray(target[start:end], dtype=np.float64)
+    if block.shape[1] == 1:
+        return block[:, 0], np.zeros(len(block))
+    mid = (block[:, 0] + block[:, 1]) * 0.5
+    side = mid - block[:, 1]
+    return mid, side
+
+
+def _convolve_range(target, start, end, mid_fir, side_fir=None):
+    """Convoluciona el tramo [start, end) del mid (y del side) con sus FIR.
+
+    Equivale al modo 'same' de fftconvolve sobre la pista completa, pero solo
+    lee las muestras que afectan al tramo (overlap-save).
+    """
+    fir_size = len(mid_fir)
+    offset = (fir_size - 1) // 2
+    segment_start = start + offset - fir_size + 1
+    segment_end = end + offset
+
+    low = max(segment_start, 0)
+    high = min(segment_end, size(target))
+    mid, side = _mid_side(target, low, high)
+
+    padding = (low - segment_start, segment_end - high)
+    if padding != (0, 0):
+        mid = np.pad(mid, padding)
+        side = np.pad(side, padding)
+
+    result_mid = signal.fftconvolve(mid, mid_fir, "valid")
+    if side_fir is None:
+        return result_mid
+    return result_mid, signal.fftconvolve(side, side_fir, "valid")
+
+
+def analyze_target(target, profile, config=None, progress_callback=None):
+    """Fase de análisis: calcula los FIR de matching y la ganancia del objetivo.
+
+    Recorre el objetivo pieza a pieza (como matchering, piezas de hasta
+    max_piece_size muestras), así que la memoria no depende de la duración.
+    'progress_callback' recibe la fracción completada tras cada pieza.
+    Devuelve el plan que necesita apply_match.
+    """
+    if config is None:
+        config = mg.Config()
+
+    # Matching de niveles
+    debug_line()
+    info(Code.INFO_MATCHING_LEVELS)
+    length = size(target)
+    divisions = int(length / config.max_piece_size) + 1
+    piece_size = int(length / divisions)
+    debug(f"The TARGET will be divided into {divisions} pieces of {piece_size} samples")
+
+    # Una pasada de análisis más una por cada corrección de RMS
+    total_pieces = divisions * (1 + config.rms_correction_steps)
+    done_pieces = 0
+
+    def piece_done():
+        nonlocal done_pieces
+        done_pieces += 1
+        if progress_callback:
+            progress_callback(done_pieces / total_pieces)
+
+    rmses = np.empty(divisions)
+    mid_ffts = np.empty((divisions, config.fft_size // 2 + 1))
+    side_ffts = np.empty_like(mid_ffts)
+    for i in range(divisions):
+        mid, side = _mid_side(target, i * piece_size, (i + 1) * piece_size)
+        rmses[i] = rms(mid)
+        mid_ffts[i] = _average_fft(mid[None, :], config)
+        side_ffts[i] = _average_fft(side[None, :], config)
+        piece_done()
+
+    loudest_piece_idxs, target_match_rms = get_lpis_and_match_rms(rmses, rms(rmses))
+    gain = profile['match_rms'] / max(config.min_value, target_match_rms)
+    debug(f"The RMS coefficient is: {to_db(gain)}")
+
+    # Matching de frecuencias
+    debug_line()
+    info(Code.INFO_MATCHING_FREQS)
+    mid_fir = _get_fir(
+        mid_ffts[loudest_piece_idxs].mean(0) * gain, profile['mid_fft'], "mid", config
+    )
+    side_fir = _get_fir(
+        side_ffts[loudest_piece_idxs].mean(0) * gain, profile['side_fft'], "side", config
+    )
+    del mid_ffts, side_ffts
+
+    # Corrección de niveles sobre el mid ya ecualizado
+    debug_line()
+    info(Code.INFO_CORRECTING_LEVELS)
+    for step in range(1, config.rms_correction_steps + 1):
+        debug(f"Applying RMS correction #{step}...")
+        for i in range(divisions):
+            result_mid = _convolve_range(target, i * piece_size, (i + 1) * piece_size, mid_fir)
+            rmses[i] = rms(clip(result_mid * gain))
+            piece_done()
+        _, clipped_match_rms = get_lpis_and_match_rms(rmses, rms(rmses))
+        gain *= profile['match_rms'] / max(config.min_value, clipped_match_rms)
+
+    return {
+        'mid_fir': mid_fir,
+        'side_fir': side_fir,
+        'gain': float(gain),
+        'final_amplitude_coefficient': profile['final_amplitude_coefficient'],
+    }
+
+
+def apply_match(target, plan, config=None, block_size=1 << 18, timer=None):
+    """Fase de aplicación: EQ, ganancia y limitador por bloques.
+
+    Genera bloques float32 (muestras, 2) en orden; cada bloque está listo
+    para escribirse en cuanto se produce y la memoria queda acotada por
+    block_size en lugar de por la duración de la pista. Con 'timer' se
+    miden por separado las etapas de matching y de limitación.
+    """
+    if config is None:
+        config = mg.Config()
+
+    debug_line()
+    info(Code.INFO_FINALIZING)
+    limiter = StreamingLimiter(config)
+    length = size(target)
+    gain = plan['gain']
+
+    for start in range(0, length, block_size):
+        end = min(start + block_size, length)
+        context_start = max(0, start - limiter.margin)
+        context_end = min(length, end + limiter.margin)
+
+        with stage(timer, 'matching'):
+            result_mid, result_side = _convolve_range(
+                target, context_start, context_end, plan['mid_fir'], plan['side_fir']
+            )
+            result = ms_to_lr(result_mid * gain, result_side * gain)
+            del result_mid, result_side
+
+        with stage(timer, 'limiting'):
+            result = limiter.process(result, start - context_start, end - context_start)
+            result = amplify(result, plan['final_amplitude_coefficient'])
+
+            # Igual que al exportar a PCM, el resultado queda dentro de [-1, 1]
+            result = np.clip(result, -1.0, 1.0).astype(np.float32)
+
+        yield result
+
+
+def master_with_profile(target, target_sr, profile, config=None):
+    """Masteriza el audio objetivo usando un perfil de referencia ya calculado.
+
+    Devuelve una tupla (resultado, sample_rate) con el resultado en float32.
+    """
+    if config is None:
+        config = mg.Config()
+
+    target = prepare_target(target, target_sr, config)
+    plan = analyze_target(target, profile, config)
+
+    result = np.empty((size(target), 2), dtype=np.float32)
+    position = 0
+    for block in apply_match(target, plan, config):
+        result[position:position + len(block)] = block
+        position += len(block)
+
+    return result, config.internal_sample_rate
+
+
+def master_arrays(target, target_sr, reference, reference_sr, config=None):
+    """Masteriza el audio objetivo contra la referencia directamente en memoria.
+
+    Ejecuta las mismas etapas que mg.process (comprobación, matching de niveles,
+    matching de frecuencias, corrección y limitación) pero sobre los arrays ya
+    cargados, sin escribir ni leer archivos intermedios.
+
+    Devuelve una tupla (resultado, sample_rate) con el resultado en float32.
+    """
+    if config is None:
+        config = mg.Config()
+
+    if not config.allow_equality:
+        check_equality(to_2d(target), to_2d(reference))
+
+    profile = analyze_reference(reference, reference_sr, config)
+    return master_with_profile(target, target_sr, profile, config)
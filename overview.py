@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+# Versión del formato de los resúmenes guardados: cambiarla invalida los anteriores
+OVERVIEW_VERSION = 1
+
+# Bytes reservados para la cabecera JSON de un resumen guardado
+HEADER_SIZE = 4096
+
+
+class SpectrumAccumulator:
+    """Espectro medio de magnitud (ventana Hann, 50% de solape) calculado por bloques.
+
+    Los bloques que se van añadiendo forman una sola señal: las muestras del
+    segmento que cruza el límite entre dos bloques se conservan para el
+    siguiente.
+    """
+
+    def __init__(self, window_size, dtype=np.float32, chunk_frames=256):
+        self.window_size = window_size
+        self.hop_size = window_size // 2
+        self.window = np.hanning(window_size).astype(dtype, copy=False)
+        self.chunk_frames = chunk_frames
+        self.spectrum = np.zeros(window_size // 2 + 1)
+        self.num_segments = 0
+        self.tail = np.empty(0, dtype=dtype)
+
+    def update(self, audio_data):
+        buffer = np.concatenate([self.tail, audio_data]) if len(self.tail) else audio_data
+        if len(buffer) < self.window_size:
+            self.tail = buffer.copy()
+            return
+
+        # Vista de segmentos solapados sin copiar datos
+        frames = np.lib.stride_tricks.sliding_window_view(buffer, self.window_size)[::self.hop_size]
+
+        # FFT por bloques de segmentos para acotar la memoria
+        for start in range(0, len(frames), self.chunk_frames):
+            block = frames[start:start + self.chunk_frames] * self.window
+            self.spectrum += np.abs(np.fft.rfft(block, axis=1)).sum(axis=0)
+        self.num_segments += len(frames)
+        self.tail = buffer[len(frames) * self.hop_size:].copy()
+
+    def result(self, sample_rate):
+        """Devuelve (espectro medio, frecuencias)."""
+        spectrum = self.spectrum / max(self.num_segments, 1)  # Evitar división por cero
+        freqs = np.fft.rfftfreq(self.window_size, 1/sample_rate)
+        return spectrum, freqs
+
+
+def average_spectrum(audio_data, window_size, sample_rate, chunk_frames=256):
+    """Calcula el espectro medio de magnitud usando ventana Hann y 50% de solape."""
+    accumulator = SpectrumAccumulator(window_size, audio_data.dtype, chunk_frames)
+    accumulator.update(audio_data)
+    return accumulator.result(sample_rate)
+
+
+class OverviewLevel:
+    """Un nivel de la pirámide: mínimo, máximo y RMS por bloque de muestras."""
+
+    def __init__(self, block_size, mins, maxs, sumsq, counts):
+        self.block_size = block_size
+        self.mins = mins
+        self.maxs = maxs
+        self.sumsq = sumsq
+        self.counts = counts
+
+    @property
+    def rms(self):
+        return np.sqrt(self.sumsq / self.counts)
+
+    def reduce(self, factor):
+        """Construye el siguiente nivel agrupando 'factor' bloques."""
+        edges = np.arange(0, len(self.mins), factor)
+        return OverviewLevel(
+            self.block_size * factor,
+            np.minimum.reduceat(self.mins, edges),
+            np.maximum.reduceat(self.maxs, edges),
+            np.add.reduceat(self.sumsq, edges),
+            np.add.reduceat(self.counts, edges)
+        )
+
+
+class AudioOverview:
+    """Resumen de una pista para visualización, calculado una sola vez.
+
+    Contiene una pirámide de niveles mínimo/máximo/RMS de la mezcla mono,
+    normalizada a [-1, 1], y el espectro medio de la pista.
+    """
+
+    def __init__(self, levels, spectrum, freqs, length, sample_rate, peak):
+        self.levels = levels
+        self.spectrum = spectrum
+        self.freqs = freqs
+        self.length = length
+        self.sample_rate = sample_rate
+        self.peak = peak
+        self.offset = 0.0  # Inicio en segundos dentro de la pista (previsualizaciones)
+
+    @property
+    def duration(self):
+        return self.length / self.sample_rate
+
+    @property
+    def end_time(self):
+        return self.offset + self.duration
+
+    def envelope(self, num_bins, start=0, end=None):
+        """Devuelve (tiempo, mínimos, máximos) para 'num_bins' columnas.
+
+        Usa el nivel más grueso que aún tiene resolución suficiente para el
+        rango [start, end) en muestras, así que el coste no depende de la
+        longitud de la pista.
+        """
+        end = self.length if end is None else min(end, self.length)
+        span = max(end - start, 1)
+
+        level = self.levels[0]
+        for candidate in reversed(self.levels):
+            if span / candidate.block_size >= num_bins:
+                level = candidate
+                break
+
+        first = start // level.block_size
+        last = -(-end // level.block_size)
+        mins = level.mins[first:last]
+        maxs = level.maxs[first:last]
+        block_starts = np.arange(first, last) * level.block_size
+
+        if len(mins) > num_bins:
+            edges = np.linspace(0, len(mins), num_bins + 1).astype(np.int64)[:-1]
+            mins = np.minimum.reduceat(mins, edges)
+            maxs = np.maximum.reduceat(maxs, edges)
+            block_starts = block_starts[edges]
+
+        return block_starts / self.sample_rate + self.offset, mins, maxs
+
+
+def build_overview(audio, sample_rate, base_block=256, factor=4, min_blocks=64,
+                   window_size=8192, chunk_size=1 << 20):
+    """Construye la pirámide de niveles y el espectro medio en una sola pasada.
+
+    El audio se recorre por bloques de 'chunk_size' muestras, de modo que la
+    mezcla mono nunca se materializa completa en memoria.
+    """
+    length = len(audio)
+    hop_size = window_size // 2
+    # Los bloques deben coincidir con los límites de bloques y segmentos
+    chunk_size = max(chunk_size // (base_block * hop_size), 1) * base_block * hop_size
+
+    num_blocks = -(-length // base_block)
+    mins = np.empty(num_blocks, dtype=np.float32)
+    maxs = np.empty(num_blocks, dtype=np.float32)
+    sumsq = np.empty(num_blocks, dtype=np.float64)
+    spectrum = SpectrumAccumulator(window_size)
+
+    for start in range(0, length, chunk_size):
+        chunk = audio[start:start + chunk_size]
+        mono = chunk.mean(axis=1, dtype=np.float32) if chunk.ndim > 1 else chunk.astype(np.float32, copy=False)
+
+        # Niveles base
+        edges = np.arange(0, len(mono), base_block)
+        first = start // base_block
+        mins[first:first + len(edges)] = np.minimum.reduceat(mono, edges)
+        maxs[first:first + len(edges)] = np.maximum.reduceat(mono, edges)
+        sumsq[first:first + len(edges)] = np.add.reduceat(np.square(mono, dtype=np.float64), edges)
+
+        spectrum.update(mono)
+
+    counts = np.full(num_blocks, base_block, dtype=np.float64)
+    if num_blocks:
+        counts[-1] = length - (num_blocks - 1) * base_block
+
+    # Normalizar a [-1, 1] como hace la visualización
+    spectrum, freqs = spectrum.result(sample_rate)
+    peak = float(max(np.max(np.abs(mins), initial=0), np.max(np.abs(maxs), initial=0)))
+    if peak > 0:
+        mins /= peak
+        maxs /= peak
+        sumsq /= peak * peak
+        spectrum /= peak
+
+    levels = [OverviewLevel(base_block, mins, maxs, sumsq, counts)]
+    while len(levels[-1].mins) > min_blocks:
+        levels.append(levels[-1].reduce(factor))
+
+    return AudioOverview(levels, spectrum, freqs, length, sample_rate, peak)
+
+
+def overview_key(file_path):
+    """Clave del resumen de un archivo: ruta, fecha de modificación y tamaño."""
+    info = os.stat(file_path)
+    payload = f"{OVERVIEW_VERSION}|{os.path.abspath(file_path)}|{info.st_mtime_ns}|{info.st_size}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def save_overview(file_path, overview):
+    """Guarda un resumen como archivo .peaks de forma atómica.
+
+    El archivo es una cabecera JSON de HEADER_SIZE bytes seguida de los
+    datos en float32: el espectro medio y, por cada nivel de la pirámide,
+    mínimos, máximos, suma de cuadrados y número de muestras por bloque.
+    """
+    arrays = [overview.spectrum]
+    levels = []
+    for level in overview.levels:
+        levels.append({'block_size': level.block_size, 'blocks': len(level.mins)})
+        arrays.extend([level.mins, level.maxs, level.sumsq, level.counts])
+
+    header = json.dumps({
+        'version': OVERVIEW_VERSION,
+        'length': overview.length,
+        'sample_rate': overview.sample_rate,
+        'peak': overview.peak,
+        'window_size': 2 * (len(overview.spectrum) - 1),
+        'levels': levels,
+    }).encode('utf-8')
+    if len(header) > HEADER_SIZE:
+        raise ValueError("Cabecera del resumen demasiado grande")
+
+    # Temporal con nombre único: dos cargas del mismo archivo no se pisan
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header.ljust(HEADER_SIZE))
+            for array in arrays:
+                f.write(np.ascontiguousarray(array, dtype=np.float32).tobytes())
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def load_overview(file_path):
+    """Carga un resumen guardado con save_overview sin leerlo entero.
+
+    Los datos se mapean en memoria en solo lectura: la visualización solo
+    toca los bloques del nivel que necesita.
+    """
+    with open(file_path, 'rb') as f:
+        header = json.loads(f.read(HEADER_SIZE).decode('utf-8'))
+    if header.get('version') != OVERVIEW_VERSION:
+        raise ValueError("Versión de resumen no compatible")
+
+    data = np.memmap(file_path, dtype=np.float32, mode='r', offset=HEADER_SIZE)
+    window_size = header['window_size']
+    position = window_size // 2 + 1
+    spectrum = data[:position]
+
+    levels = []
+    for level in header['levels']:
+        blocks = level['blocks']
+        mins, maxs, sumsq, counts = (
+            data[position + i * blocks:position + (i + 1) * blocks] for i in range(4)
+        )
+        position += 4 * blocks
+        levels.append(OverviewLevel(level['block_size'], mins, maxs, sumsq, counts))
+    if position != len(data):
+        raise ValueError("Resumen incompleto o dañado")
+
+    freqs = np.fft.rfftfreq(window_size, 1/header['sample_rate'])
+    return AudioOverview(levels, spectrum, freqs, header['length'], header['sample_rate'], header['peak'])
@@ -0,0 +1,316 @@
+import argparse
+import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import soundfile as sf
+
+from audio_processor import AUDIO_EXTENSIONS, find_audio_files
+from audio_stats import compute_stats, to_db
+from overview import average_spectrum
+
+# Versión de los vectores de características: cambiarla obliga a reindexar
+LIBRARY_VERSION = 2
+
+# Índice por defecto, junto a los demás resultados
+DEFAULT_INDEX = os.path.join("resultados", "biblioteca_referencias.npz")
+
+# Bandas logarítmicas del balance tonal
+NUM_BANDS = 16
+BAND_RANGE = (30.0, 16000.0)
+SPECTRUM_WINDOW = 4096
+
+FEATURE_NAMES = [f'band_{i}' for i in range(NUM_BANDS)] + ['loudness', 'crest', 'width']
+
+# Peso de cada característica en la distancia: el balance tonal cuenta en
+# conjunto tanto como loudness, cresta y anchura juntas
+FEATURE_WEIGHTS = np.array([3.0 / NUM_BANDS] * NUM_BANDS + [1.0, 1.0, 1.0])
+
+# Suelo de la anchura estéreo (side/mid) en dB, para pistas mono
+WIDTH_FLOOR_DB = -60.0
+
+# Referencias sugeridas por defecto
+DEFAULT_SUGGESTIONS = 5
+
+
+def _band_edges(sample_rate):
+    """Índices de los bins de la FFT que delimitan cada banda."""
+    freqs = np.fft.rfftfreq(SPECTRUM_WINDOW, 1 / sample_rate)
+    high = min(BAND_RANGE[1], sample_rate / 2)
+    edges = np.geomspace(BAND_RANGE[0], high, NUM_BANDS + 1)
+    return np.searchsorted(freqs, edges)
+
+
+def track_features(audio, sample_rate, stats=None):
+    """Vector de características de una pista para comparar referencias.
+
+    Incluye el balance tonal del canal mid (energía media por banda en dB
+    respecto a la media de las bandas, independiente del nivel), la
+    loudness integrada, el factor de cresta y la anchura estéreo (energía
+    del side respecto al mid).
+
+    La loudness se da como si el audio se hubiera normalizado al cargarlo
+    (pico por encima de 1.0 reducido a 1.0, como hace AudioProcessor), así
+    que el mismo archivo da el mismo vector leído en bruto o ya cargado.
+    """
+    from loudness import integrated_loudness
+
+    if audio.ndim == 1:
+        audio = audio.reshape(-1, 1)
+    if stats is None:
+        stats = compute_stats(audio)
+
+    if audio.shape[1] > 1:
+        mid = audio[:, :2].mean(axis=1)
+        side = (audio[:, 0] - audio[:, 1]) * 0.5
+        mid_energy = float(np.dot(mid, mid))
+        side_energy = float(np.dot(side, side))
+        width = 10 * np.log10(side_energy / mid_energy) if side_energy > 0 and mid_energy > 0 else WIDTH_FLOOR_DB
+    else:
+        mid = audio[:, 0]
+        width = WIDTH_FLOOR_DB
+
+    spectrum, _ = average_spectrum(mid, SPECTRUM_WINDOW, sample_rate)
+    power = np.square(spectrum)
+    edges = _band_edges(sample_rate)
+    bands = np.array([
+        power[start:max(end, start + 1)].mean() for start, end in zip(edges[:-1], edges[1:])
+    ])
+    bands = 10 * np.log10(np.maximum(bands, 1e-20))
+    bands -= bands.mean()
+
+    crest = to_db(stats['peak']) - to_db(stats['rms'])
+    loudness = integrated_loudness(audio, sample_rate)
+    if stats['peak'] > 1.0:
+        loudness -= to_db(stats['peak'])
+    features = np.concatenate([
+        bands,
+        [loudness, crest, max(width, WIDTH_FLOOR_DB)]
+    ])
+    return features.astype(np.float32)
+
+
+def _index_file(file_path):
+    """Calcula las características de un archivo (en un proceso del pool)."""
+    audio, sample_rate = sf.read(file_path, dtype='float32', always_2d=True)
+    if audio.size == 0:
+        raise ValueError("El archivo no contiene audio")
+    return track_features(audio, sample_rate), sample_rate, len(audio) / sample_rate
+
+
+def library_files(sources):
+    """Archivos de audio de las fuentes indicadas, recorriendo carpetas con subcarpetas."""
+    if isinstance(sources, str):
+        sources = [sources]
+
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            for folder, subfolders, names in os.walk(source):
+                subfolders.sort()
+                files.extend(
+                    os.path.join(folder, name) for name in sorted(names)
+                    if name.lower().endswith(AUDIO_EXTENSIONS)
+                )
+        else:
+            files.extend(find_audio_files(source))
+    return list(dict.fromkeys(os.path.abspath(path) for path in files))
+
+
+def _file_stamp(file_path):
+    info = os.stat(file_path)
+    return info.st_mtime_ns, info.st_size
+
+
+class ReferenceLibrary:
+    """Índice en disco de una biblioteca de referencias con búsqueda por similitud.
+
+    Cada referencia se resume en un vector de características (ver
+    track_features). Las búsquedas normalizan cada característica con la
+    media y la desviación de la biblioteca y devuelven las referencias a
+    menor distancia euclídea ponderada, sin volver a leer ningún audio.
+    """
+
+    def __init__(self, index_path=DEFAULT_INDEX):
+        self.logger = logging.getLogger('MasterW')
+        self.index_path = index_path
+        self.paths = []
+        self.stamps = np.empty((0, 2), dtype=np.int64)
+        self.sample_rates = np.empty(0, dtype=np.int64)
+        self.durations = np.empty(0)
+        self.features = np.empty((0, len(FEATURE_NAMES)), dtype=np.float32)
+        self._scaled = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    def load(self):
+        """Carga el índice desde disco. Devuelve False si no existe o no es compatible."""
+        if not os.path.exists(self.index_path):
+            return False
+        with np.load(self.index_path) as data:
+            if int(data['version']) != LIBRARY_VERSION:
+                self.logger.warning("Índice de referencias de otra versión: se reindexará")
+                return False
+            self.paths = data['paths'].tolist()
+            self.stamps = data['stamps']
+            self.sample_rates = data['sample_rates']
+            self.durations = data['durations']
+            self.features = data['features']
+        self._scaled = None
+        return True
+
+    def save(self):
+        """Guarda el índice de forma atómica."""
+        folder = os.path.dirname(os.path.abspath(self.index_path))
+        os.makedirs(folder, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(
+                    f,
+                    version=LIBRARY_VERSION,
+                    paths=np.array(self.paths, dtype=str),
+                    stamps=self.stamps,
+                    sample_rates=self.sample_rates,
+                    durations=self.durations,
+                    features=self.features
+                )
+            os.replace(temp_path, self.index_path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def scan(self, sources, jobs=None):
+        """Indexa en paralelo los archivos nuevos o modificados de las fuentes.
+
+        Los archivos sin cambios (misma fecha de modificación y tamaño) se
+        conservan sin leerlos y los que ya no existen se eliminan del índice.
+        Devuelve el número de archivos indexados.
+        """
+        files = library_files(sources)
+        known = {path: i for i, path in enumerate(self.paths)}
+        keep = {i for i, path in enumerate(self.paths) if os.path.exists(path)}
+        pending = []
+        for path in files:
+            index = known.get(path)
+            if index is not None and tuple(self.stamps[index]) == _file_stamp(path):
+                continue
+            if index is not None:
+                keep.discard(index)
+            pending.append(path)
+
+        keep = sorted(keep)
+        entries = {
+            'paths': [self.paths[i] for i in keep],
+            'stamps': [tuple(self.stamps[i]) for i in keep],
+            'sample_rates': [int(self.sample_rates[i]) for i in keep],
+            'durations': [float(self.durations[i]) for i in keep],
+            'features': [self.features[i] for i in keep],
+        }
+
+        jobs = max(1, min(jobs or os.cpu_count() or 1, len(pending) or 1))
+        if pending:
+            self.logger.info(f"Indexando {len(pending)} referencias con {jobs} procesos")
+        indexed = 0
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(_index_file, path): path for path in pending}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    features, sample_rate, duration = future.result()
+                except Exception as e:
+                    self.logger.warning(f"No se pudo indexar {os.path.basename(path)}: {str(e)}")
+                    continue
+                entries['paths'].append(path)
+                entries['stamps'].append(_file_stamp(path))
+                entries['sample_rates'].append(sample_rate)
+                entries['durations'].append(duration)
+                entries['features'].append(features)
+                indexed += 1
+
+        self.paths = entries['paths']
+        self.stamps = np.array(entries['stamps'], dtype=np.int64).reshape(-1, 2)
+        self.sample_rates = np.array(entries['sample_rates'], dtype=np.int64)
+        self.durations = np.array(entries['durations'], dtype=np.float64)
+        self.features = np.array(entries['features'], dtype=np.float32).reshape(-1, len(FEATURE_NAMES))
+        self._scaled = None
+        return indexed
+
+    def _scaling(self):
+        """Media, escala y características normalizadas, calculadas una vez por índice."""
+        if self._scaled is None:
+            features = self.features.astype(np.float64)
+            mean = features.mean(axis=0)
+            scale = features.std(axis=0)
+            scale[scale < 1e-6] = 1.0
+            self._scaled = (mean, scale, (features - mean) / scale * np.sqrt(FEATURE_WEIGHTS))
+        return self._scaled
+
+    def nearest(self, features, count=DEFAULT_SUGGESTIONS, exclude=None):
+        """Las 'count' referencias más parecidas a un vector de características.
+
+        Devuelve una lista de (ruta, distancia) ordenada de menor a mayor
+        distancia; 'exclude' es una ruta que no debe sugerirse (la propia
+        pista, si está en la biblioteca).
+        """
+        if not self.paths or count <= 0:
+            return []
+        mean, scale, scaled = self._scaling()
+        query = (np.asarray(features, dtype=np.float64) - mean) / scale * np.sqrt(FEATURE_WEIGHTS)
+        distances = np.sqrt(np.square(scaled - query).sum(axis=1))
+        candidates = np.arange(len(distances))
+        if exclude is not None:
+            exclude = os.path.abspath(exclude)
+            candidates = candidates[[path != exclude for path in self.paths]]
+
+        count = min(count, len(candidates))
+        if count == 0:
+            return []
+        if count < len(candidates):
+            candidates = candidates[np.argpartition(distances[candidates], count - 1)[:count]]
+        candidates = candidates[np.argsort(distances[candidates])]
+        return [(self.paths[i], float(distances[i])) for i in candidates]
+
+    def suggest(self, audio, sample_rate, count=DEFAULT_SUGGESTIONS, exclude=None, stats=None):
+        """Sugiere referencias para un audio ya cargado."""
+        return self.nearest(track_features(audio, sample_rate, stats), count, exclude)
+
+
+def main(argv=None):
+    """Punto de entrada del índice de referencias."""
+    parser = argparse.ArgumentParser(
+        prog="master-w library",
+        description="Indexa una biblioteca de referencias y sugiere las más parecidas a un objetivo."
+    )
+    parser.add_argument('-i', '--index', default=DEFAULT_INDEX, help="Archivo del índice")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    index_parser = subparsers.add_parser('index', help="Indexa (o actualiza) carpetas de referencias")
+    index_parser.add_argument('sources', nargs='+', help="Archivos, carpetas o patrones")
+    index_parser.add_argument('-j', '--jobs', type=int, default=None,
+                              help="Número de procesos (por defecto, uno por núcleo)")
+    suggest_parser = subparsers.add_parser('suggest', help="Sugiere referencias para un objetivo")
+    suggest_parser.add_argument('target', help="Archivo objetivo")
+    suggest_parser.add_argument('-n', '--count', type=int, default=DEFAULT_SUGGESTIONS,
+                                help=f"Número de sugerencias (por defecto: {DEFAULT_SUGGESTIONS})")
+    args = parser.parse_args(argv)
+    logger = logging.getLogger('MasterW')
+
+    library = ReferenceLibrary(args.index)
+    library.load()
+    if args.command == 'index':
+        indexed = library.scan(args.sources, args.jobs)
+        library.save()
+        logger.info(f"{indexed} referencias indexadas; {len(library)} en total en: {args.index}")
+        return 0
+
+    if not len(library):
+        parser.error(f"El índice {args.index} está vacío: use 'index' primero")
+    features, _, _ = _index_file(args.target)
+    for path, distance in library.nearest(features, args.count, exclude=args.target):
+        print(f"{distance:8.3f}  {path}")
+    return 0
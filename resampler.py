@@ -0,0 +1,166 @@
+import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
+from scipy.signal import firwin, resample_poly
+
+# Muestras de entrada por bloque al remuestrear
+CHUNK_SIZE = 1 << 18
+
+
+def rate_ratio(from_rate, to_rate):
+    """Factores (up, down) irreducibles para pasar de from_rate a to_rate."""
+    divisor = math.gcd(int(from_rate), int(to_rate))
+    return int(to_rate) // divisor, int(from_rate) // divisor
+
+
+@lru_cache(maxsize=16)
+def design_filter(up, down):
+    """FIR paso bajo para una relación up/down, diseñado una sola vez.
+
+    Es el mismo filtro que resample_poly diseña por defecto (Kaiser, beta 5)
+    en cada llamada; guardarlo evita rediseñarlo para cada bloque y pista.
+    """
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    taps = firwin(2 * half_len + 1, 1.0 / max_rate, window=('kaiser', 5.0))
+    taps.flags.writeable = False
+    return taps
+
+
+class StreamingResampler:
+    """Remuestreo polifásico por bloques de una señal (muestras, canales).
+
+    Cada bloque se procesa con un margen de contexto a cada lado, alineado a
+    la relación de remuestreo, de modo que el resultado coincide con
+    resample_poly sobre la pista entera. Los canales se procesan en paralelo
+    (scipy libera el GIL al filtrar).
+    """
+
+    def __init__(self, from_rate, to_rate, channels=2):
+        self.up, self.down = rate_ratio(from_rate, to_rate)
+        self.taps = design_filter(self.up, self.down)
+        self.channels = channels
+
+        # Contexto necesario (en muestras de entrada), múltiplo de 'down' para
+        # que cada bloque empiece en una muestra de salida exacta
+        half_len = (len(self.taps) - 1) // 2
+        self.margin = self._align(half_len // self.up + 2)
+
+        self.buffer = None  # Entrada pendiente desde la posición 'base'
+        self.base = 0
+        self.done = 0  # Entrada ya convertida en salida
+        self.executor = ThreadPoolExecutor(max_workers=channels) if channels > 1 else None
+
+    def _align(self, frames):
+        return -(-frames // self.down) * self.down
+
+    def _output_index(self, position):
+        return -(-position * self.up // self.down)
+
+    def _resample(self, segment):
+        columns = [segment[:, channel] for channel in range(segment.shape[1])]
+
+        def run(column):
+            return resample_poly(column, self.up, self.down, window=self.taps)
+
+        if self.executor is not None:
+            columns = list(self.executor.map(run, columns))
+        else:
+            columns = [run(column) for column in columns]
+        return np.stack(columns, axis=1).astype(segment.dtype, copy=False)
+
+    def _emit(self, end, final=False):
+        """Salida correspondiente a la entrada de 'done' a 'end'."""
+        available = self.base + len(self.buffer)
+        stop = available if final else end + self.margin
+        output = self._resample(self.buffer[:stop - self.base])
+
+        offset = self._output_index(self.base)
+        first = self._output_index(self.done) - offset
+        last = (self._output_index(available) if final else self._output_index(end)) - offset
+        self.done = end
+
+        # Descartar la entrada que ya no hace falta como contexto
+        keep_from = max(0, end - self.margin)
+        self.buffer = self.buffer[keep_from - self.base:]
+        self.base = keep_from
+        return output[first:last]
+
+    def process(self, block):
+        """Añade un bloque y devuelve la salida que ya puede calcularse."""
+        block = np.asarray(block)
+        if block.ndim == 1:
+            block = block.reshape(-1, 1)
+        if self.buffer is None:
+            self.buffer = block.copy()
+        else:
+            self.buffer = np.concatenate([self.buffer, block])
+
+        # Hace falta 'margin' muestras por delante del último punto convertido
+        available = self.base + len(self.buffer)
+        end = (available - self.margin) // self.down * self.down
+        if end <= self.done:
+            return np.empty((0, self.buffer.shape[1]), dtype=self.buffer.dtype)
+        return self._emit(end)
+
+    def flush(self):
+        """Devuelve el resto de la salida al terminar la entrada."""
+        if self.buffer is None:
+            return np.empty((0, self.channels), dtype=np.float32)
+        output = self._emit(self.base + len(self.buffer), final=True)
+        self.buffer = None
+        return output
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+def resample_blocks(blocks, from_rate, to_rate, channels=2):
+    """Remuestrea una secuencia de bloques, devolviendo bloques de salida."""
+    if int(from_rate) == int(to_rate):
+        yield from blocks
+        return
+    resampler = StreamingResampler(from_rate, to_rate, channels)
+    try:
+        for block in blocks:
+            output = resampler.process(block)
+            if len(output):
+                yield output
+        output = resampler.flush()
+        if len(output):
+            yield output
+    finally:
+        resampler.close()
+
+
+def resample(audio, from_rate, to_rate, chunk_size=CHUNK_SIZE, out=None):
+    """Remuestrea una pista completa por bloques.
+
+    Devuelve el audio convertido (en 'out', si se indica, que debe tener
+    output_length muestras) con el mismo tipo de dato que la entrada.
+    """
+    audio = np.asarray(audio)
+    if int(from_rate) == int(to_rate):
+        return audio
+    squeeze = audio.ndim == 1
+    if squeeze:
+        audio = audio.reshape(-1, 1)
+
+    length = output_length(len(audio), from_rate, to_rate)
+    if out is None:
+        out = np.empty((length, audio.shape[1]), dtype=audio.dtype)
+    blocks = (audio[start:start + chunk_size] for start in range(0, len(audio), chunk_size))
+    position = 0
+    for block in resample_blocks(blocks, from_rate, to_rate, audio.shape[1]):
+        out[position:position + len(block)] = block
+        position += len(block)
+    return out[:, 0] if squeeze else out
+
+
+def output_length(length, from_rate, to_rate):
+    """Número de muestras tras remuestrear 'length' muestras."""
+    up, down = rate_ratio(from_rate, to_rate)
+    return -(-length * up // down)
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+import numpy as np
+
+# Versión de las entradas: cambiarla invalida los resultados guardados
+# (2: remuestreo polifásico propio en lugar del de matchering)
+RESULT_CACHE_VERSION = 2
+
+# Tamaño máximo por defecto de la caché de resultados
+DEFAULT_MAX_MB = 2048
+
+# Parámetros de matchering que no cambian el resultado
+IGNORED_CONFIG = {'temp_folder'}
+
+# Sufijo de los archivos temporales de escritura, que no cuentan como entradas
+TEMP_SUFFIX = '.tmp'
+
+
+def hash_file(file_path, chunk_size=1 << 20):
+    """Calcula el hash SHA-256 del contenido de un archivo."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _config_params(config):
+    """Parámetros de una configuración de matchering como diccionario serializable."""
+    params = {}
+    for name, value in vars(config).items():
+        if name in IGNORED_CONFIG:
+            continue
+        params[name] = _config_params(value) if hasattr(value, '__dict__') else value
+    return params
+
+
+def result_key(target_hash, reference_hash, config, mode='in_memory'):
+    """Clave de un resultado: contenido de ambas pistas más la configuración."""
+    params = {
+        'version': RESULT_CACHE_VERSION,
+        'mode': mode,
+        'config': _config_params(config),
+    }
+    payload = target_hash + reference_hash + json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Caché en disco de resultados de masterización direccionada por contenido.
+
+    Cada entrada es el audio del resultado (.npy) más sus metadatos (.json):
+    sample rate y, si ya se calcularon, estadísticas y loudness. El uso de
+    una entrada actualiza su fecha de modificación y, al superar max_mb, se
+    eliminan las menos usadas recientemente (LRU).
+    """
+
+    def __init__(self, folder, max_mb=DEFAULT_MAX_MB):
+        self.folder = folder
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+    def _paths(self, key):
+        base = os.path.join(self.folder, key)
+        return base + '.npy', base + '.json'
+
+    def get(self, key):
+        """Devuelve (audio, metadatos) de una entrada, o None si no existe.
+
+        El audio se abre mapeado en solo lectura: cópielo antes de soltarlo.
+        """
+        audio_path, meta_path = self._paths(key)
+        if not (os.path.exists(audio_path) and os.path.exists(meta_path)):
+            return None
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        audio = np.load(audio_path, mmap_mode='r')
+
+        # Marcar la entrada como usada recientemente
+        for path in [audio_path, meta_path]:
+            os.utime(path)
+        return audio, meta
+
+    def put(self, key, audio, sample_rate, stats=None, loudness=None):
+        """Guarda un resultado de forma atómica y aplica el límite de tamaño.
+
+        El audio se guarda en float32, sin pérdida para resultados de 24 bits.
+        Devuelve False si el resultado no cabe en la caché.
+        """
+        audio = np.asarray(audio, dtype=np.float32)
+        if audio.nbytes > self.max_bytes:
+            self.evict()
+            return False
+
+        os.makedirs(self.folder, exist_ok=True)
+        audio_path, meta_path = self._paths(key)
+        # Los metadatos van al final: sin ellos la entrada no se considera completa
+        with self._temp_file(audio_path) as f:
+            np.save(f, audio)
+        meta = {'sample_rate': sample_rate, 'stats': stats, 'loudness': loudness}
+        with self._temp_file(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, default=float)
+
+        self.evict()
+        return True
+
+    @contextmanager
+    def _temp_file(self, path, mode='wb', **kwargs):
+        """Escribe en un temporal propio de este proceso y lo renombra a 'path' al cerrar.
+
+        Cada escritura usa un nombre único, así que dos procesos que guardan
+        la misma entrada a la vez no pisan sus temporales.
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self.folder, prefix='.', suffix=TEMP_SUFFIX)
+        try:
+            with os.fdopen(fd, mode, **kwargs) as f:
+                yield f
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _entries(self):
+        """Entradas de la carpeta como {clave: [tamaño, último uso, rutas]}."""
+        entries = {}
+        if not os.path.isdir(self.folder):
+            return entries
+        for name in os.listdir(self.folder):
+            # Temporales de escrituras en curso (quizá de otro proceso)
+            if TEMP_SUFFIX in name:
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            entry = entries.setdefault(name.split('.', 1)[0], [0, 0.0, []])
+            entry[0] += info.st_size
+            entry[1] = max(entry[1], info.st_mtime)
+            entry[2].append(path)
+        return entries
+
+    def size(self):
+        """Espacio ocupado por la caché en bytes."""
+        return sum(entry[0] for entry in self._entries().values())
+
+    def evict(self, max_bytes=None):
+        """Elimina las entradas menos usadas hasta quedar bajo el límite.
+
+        Devuelve el número de entradas eliminadas.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._entries().values(), key=lambda entry: entry[1])
+        total = sum(entry[0] for entry in entries)
+        removed = 0
+        for size, _, paths in entries:
+            if total <= max_bytes:
+                break
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    # En uso por otro proceso (o ya eliminado): se reintentará
+                    pass
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        """Vacía la caché."""
+        return self.evict(0)
@@ -0,0 +1,133 @@
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+
+class StageTimer:
+    """Instrumentación por etapas de un trabajo de masterización.
+
+    Cada etapa acumula tiempo real y tiempo de CPU. Con 'trace_memory' se
+    mide además su memoria pico: la reservada por Python y numpy desde que
+    empezó la medida (tracemalloc). Es comparable entre plataformas pero
+    ralentiza las partes con mucho Python, así que está desactivada por
+    defecto; el registro siempre incluye el pico de memoria residente del
+    proceso desde que arrancó, que no se limita al trabajo medido.
+    Una etapa puede abrirse varias veces, por ejemplo una vez por bloque,
+    y sus tiempos se suman.
+    """
+
+    def __init__(self, job=None, trace_memory=False):
+        self.job = job or {}
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.started = None
+        self._wall_start = None
+        self._cpu_start = None
+        self._owns_tracing = False
+
+    def start(self):
+        self.started = datetime.now().isoformat(timespec='seconds')
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+        return self
+
+    @contextmanager
+    def stage(self, name):
+        """Mide el bloque 'with' como (parte de) la etapa 'name'.
+
+        Las etapas no deben anidarse: cada una reinicia el pico de memoria.
+        """
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'peak_mb': 0.0, 'calls': 0})
+            entry['wall'] += time.perf_counter() - wall
+            entry['cpu'] += time.process_time() - cpu
+            entry['calls'] += 1
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                entry['peak_mb'] = max(entry['peak_mb'], peak)
+
+    def add_stages(self, stages):
+        """Incorpora etapas medidas en otro momento o en otro proceso."""
+        for record in stages:
+            entry = self.stages.setdefault(
+                record['name'], {'wall': 0.0, 'cpu': 0.0, 'peak_mb': 0.0, 'calls': 0}
+            )
+            entry['wall'] += record['wall']
+            entry['cpu'] += record['cpu']
+            entry['peak_mb'] = max(entry['peak_mb'], record['peak_mb'])
+            entry['calls'] += record['calls']
+
+    def stage_records(self):
+        """Devuelve las etapas medidas hasta ahora, en orden."""
+        return [
+            {
+                'name': name,
+                'wall': round(entry['wall'], 4),
+                'cpu': round(entry['cpu'], 4),
+                'peak_mb': round(entry['peak_mb'], 2),
+                'calls': entry['calls'],
+            }
+            for name, entry in self.stages.items()
+        ]
+
+    def stop(self, success=True):
+        """Termina la medida y devuelve el registro del trabajo.
+
+        Puede llamarse más de una vez; tracemalloc se detiene solo si lo
+        arrancó este temporizador.
+        """
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+
+        return {
+            'job': self.job,
+            'started': self.started,
+            'success': success,
+            'wall': round(time.perf_counter() - self._wall_start, 4),
+            'cpu': round(time.process_time() - self._cpu_start, 4),
+            'process_peak_rss_mb': peak_rss_mb(),
+            'stages': self.stage_records(),
+        }
+
+
+def peak_rss_mb():
+    """Pico de memoria residente del proceso en MB desde su arranque, si el sistema lo permite."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB y macOS en bytes
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return round(peak / 1024, 2)
+
+
+def stage(timer, name):
+    """Etapa de 'timer', o un contexto vacío si no hay instrumentación."""
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+def write_timing(record, folder):
+    """Guarda el registro de tiempos de un trabajo como JSON y devuelve su ruta."""
+    os.makedirs(folder, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    file_path = os.path.join(folder, f"tiempos_{timestamp}.json")
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2, ensure_ascii=False)
+    return file_path
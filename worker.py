@@ -0,0 +1,444 @@
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from audio_stats import compute_stats
+from overview import build_overview
+from timing import StageTimer, stage
+
+# Segundos que se espera a que el proceso atienda la cancelación antes de terminarlo
+CANCEL_GRACE = 2.0
+
+# Segundos que el proceso mantiene el resultado compartido esperando a que se copie
+RELEASE_TIMEOUT = 60.0
+
+
+class JobCancelled(Exception):
+    """La masterización se canceló desde la interfaz."""
+
+
+def share_array(array):
+    """Copia un array a un bloque nuevo de memoria compartida.
+
+    Devuelve el bloque y un descriptor serializable para abrirlo en otro proceso.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    shared[...] = array
+    del shared
+    return shm, {'name': shm.name, 'shape': array.shape, 'dtype': array.dtype.str}
+
+
+def attach_array(descriptor, mode='c'):
+    """Abre un array compartido a partir de su descriptor.
+
+    Los descriptores con 'path' son archivos de respaldo (use_memmap) que se
+    mapean directamente con el modo indicado; por defecto copy-on-write, así
+    que el proceso nunca modifica la pista original. Devuelve (bloque, array),
+    con bloque None para los archivos de respaldo.
+    """
+    if 'path' in descriptor:
+        array = np.memmap(descriptor['path'], dtype=descriptor['dtype'], mode=mode,
+                          offset=descriptor.get('offset', 0), shape=tuple(descriptor['shape']))
+        return None, array
+    shm = shared_memory.SharedMemory(name=descriptor['name'])
+    array = np.ndarray(descriptor['shape'], dtype=descriptor['dtype'], buffer=shm.buf)
+    return shm, array
+
+
+def _close_shared(shm):
+    try:
+        shm.close()
+    except BufferError:
+        # Aún hay vistas vivas; el bloque se liberará al terminar el proceso
+        pass
+
+
+def _unlink_shared(name):
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+class _EventLogHandler(logging.Handler):
+    """Reenvía los mensajes del proceso de masterización a la interfaz."""
+
+    def __init__(self, events):
+        super().__init__()
+        self.events = events
+
+    def emit(self, record):
+        try:
+            self.events.put(('log', record.levelno, record.getMessage()))
+        except Exception:
+            self.handleError(record)
+
+
+def _run_job(job, events, cancel_event, release_event):
+    """Punto de entrada del proceso de masterización."""
+    import matchering as mg
+    from audio_processor import AudioProcessor
+
+    logger = logging.getLogger('MasterW')
+    logger.handlers.clear()
+    logger.addHandler(_EventLogHandler(events))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    def check_cancelled():
+        if cancel_event.is_set():
+            raise JobCancelled()
+
+    def progress(value):
+        check_cancelled()
+        events.put(('progress', value))
+
+    def log_matchering(message):
+        # matchering informa de cada paso del análisis: buen punto para cancelar
+        check_cancelled()
+        logger.info(message)
+
+    shared = []
+    result_shm = None
+    processor = None
+    try:
+        processor = AudioProcessor()
+        processor.build_overviews = False
+        processor.mg_config = job['config']
+        processor.profiles_folder = job['profiles_folder']
+
+        target_shm, processor.target_audio = attach_array(job['target'])
+        reference_shm, processor.reference_audio = attach_array(job['reference'])
+        shared.extend(shm for shm in [target_shm, reference_shm] if shm is not None)
+        processor.target_sr = job['target_sr']
+        processor.reference_sr = job['reference_sr']
+        processor.reference_hash = job['reference_hash']
+        processor.reference_profile = job['reference_profile']
+        processor.target_hash = job['target_hash']
+        processor.result_cache_folder = job['result_cache_folder']
+        processor.result_cache_max_mb = job['result_cache_max_mb']
+
+        timer = StageTimer(trace_memory=job['trace_memory']).start()
+        progress(0)
+        logger.info("Iniciando proceso de masterización en memoria...")
+        mg.log(log_matchering)
+
+        processor.analyze_match(lambda fraction: progress(30 * fraction), timer)
+        if job['reference_profile'] is None:
+            events.put(('profile', processor.reference_hash, processor.reference_profile))
+
+        # El resultado se escribe directamente en memoria compartida o, con
+        # respaldo en disco, en el archivo que la interfaz adoptará
+        length = len(processor.match_target)
+        if job['result_path'] is not None:
+            result = np.memmap(job['result_path'], dtype=np.float32, mode='w+', shape=(length, 2))
+            descriptor = {'path': job['result_path'], 'shape': result.shape, 'dtype': result.dtype.str}
+        else:
+            result_shm = shared_memory.SharedMemory(create=True, size=max(length * 2 * 4, 1))
+            shared.append(result_shm)
+            events.put(('shared', result_shm.name))
+            result = np.ndarray((length, 2), dtype=np.float32, buffer=result_shm.buf)
+            descriptor = {'name': result_shm.name, 'shape': result.shape, 'dtype': result.dtype.str}
+        processor.apply_match(
+            progress_callback=lambda fraction: progress(30 + 65 * fraction),
+            out=result,
+            timer=timer
+        )
+        if isinstance(result, np.memmap):
+            result.flush()
+
+        # Análisis del resultado aquí, para no bloquear la interfaz al recibirlo
+        sample_rate = processor.result_sr
+        with timer.stage('result_analysis'):
+            processor.audio_stats['result'] = compute_stats(result)
+            summary = {
+                'result': descriptor,
+                'sample_rate': sample_rate,
+                'stats': processor.audio_stats['result'],
+                'loudness': processor.get_loudness('result'),
+                'overview': build_overview(result, sample_rate) if job['build_overview'] else None
+            }
+        with timer.stage('cache_store'):
+            processor.store_cached_result()
+        record = timer.stop()
+        summary['stages'] = record['stages']
+        summary['cpu'] = record['cpu']
+        # El proceso se lanza para cada trabajo: su pico es el del trabajo
+        summary['peak_rss_mb'] = record['process_peak_rss_mb']
+        check_cancelled()
+        logger.info("Masterización completada exitosamente")
+        events.put(('done', summary))
+
+        # Mantener el bloque abierto hasta que la interfaz lo haya copiado
+        release_event.wait(RELEASE_TIMEOUT)
+        del result
+        result_shm = None
+
+    except JobCancelled:
+        events.put(('cancelled',))
+    except Exception as e:
+        logger.error(f"Error en el proceso de masterización: {str(e)}")
+        events.put(('error', str(e)))
+    finally:
+        if result_shm is not None:
+            # El resultado no llegó a la interfaz: nadie más lo liberará
+            _unlink_shared(result_shm.name)
+        if processor is not None:
+            processor.target_audio = None
+            processor.reference_audio = None
+            processor.result_audio = None
+            processor.match_target = None
+        for shm in shared:
+            _close_shared(shm)
+
+
+class MasteringWorker:
+    """Ejecuta una masterización en un proceso aparte.
+
+    El objetivo y la referencia se pasan al proceso en memoria compartida y
+    el resultado vuelve por el mismo camino; con use_memmap, el proceso abre
+    los archivos de respaldo de las pistas y escribe el resultado en uno
+    nuevo, sin copiar el audio a memoria. El progreso, los mensajes de log
+    y el final del trabajo llegan como eventos que la interfaz recoge con
+    poll() desde su bucle principal, así que nunca se bloquea esperando.
+    Con 'region' (inicio, fin) en muestras, solo se masteriza ese tramo del
+    objetivo (previsualización): no se consulta ni se llena la caché de
+    resultados y el resultado queda marcado como previsualización.
+    """
+
+    def __init__(self, processor, region=None):
+        self.processor = processor
+        self.region = region
+        self.logger = logging.getLogger('MasterW')
+        context = multiprocessing.get_context('spawn')
+        self.events = context.Queue()
+        self.cancel_event = context.Event()
+        self.release_event = context.Event()
+        self.context = context
+        self.process = None
+        self.shared = []
+        self.result_names = []
+        self.result_path = None  # Archivo de respaldo del resultado, hasta adoptarlo
+        self.cancel_time = None
+        self.finished = False
+        self.timer = None
+        self.child_cpu = 0.0
+        self.child_peak_rss_mb = None
+        self.launch_time = None
+        self.cached = False
+
+    def start(self):
+        """Comparte las pistas con el proceso y lo lanza.
+        
+        Si el resultado ya está en la caché, se adopta directamente y el
+        siguiente poll() lo notifica sin lanzar ningún proceso.
+        """
+        processor = self.processor
+        preview = self.region is not None
+        self.timer = processor.start_timing('preview' if preview else 'worker')
+        if not preview:
+            with self.timer.stage('cache_lookup'):
+                self.cached = processor.load_cached_result()
+        self.timer.job['cached'] = self.cached
+        if self.cached:
+            # Resultado ya calculado: no hace falta lanzar el proceso
+            return
+        
+        with self.timer.stage('share'):
+            target = self._share(processor.target_audio, 'target', self.region)
+            reference = self._share(processor.reference_audio, 'reference')
+        self.result_path = processor.backing_path('result') if processor.use_memmap else None
+
+        job = {
+            'target': target,
+            'target_sr': processor.target_sr,
+            'reference': reference,
+            'reference_sr': processor.reference_sr,
+            'reference_hash': processor.reference_hash,
+            'reference_profile': processor.reference_profile,
+            'target_hash': None if preview else processor.target_hash,
+            'result_cache_folder': None if preview else processor.result_cache_folder,
+            'result_cache_max_mb': processor.result_cache_max_mb,
+            'config': processor.mg_config,
+            'profiles_folder': processor.profiles_folder,
+            'build_overview': processor.build_overviews,
+            'trace_memory': processor.trace_memory,
+            'result_path': self.result_path
+        }
+        self.process = self.context.Process(
+            target=_run_job,
+            args=(job, self.events, self.cancel_event, self.release_event),
+            daemon=True
+        )
+        self.launch_time = time.perf_counter()
+        self.process.start()
+
+    def _share(self, audio, audio_type, region=None):
+        """Descriptor de una pista (o de su tramo 'region') para el proceso de masterización.
+
+        Las pistas respaldadas en disco se pasan por su archivo; las demás se
+        copian a memoria compartida.
+        """
+        start = 0
+        if region is not None:
+            start = region[0]
+            audio = audio[region[0]:region[1]]
+        backing_path = self.processor.backing_files.get(audio_type)
+        if backing_path is not None and isinstance(audio, np.memmap):
+            return {
+                'path': backing_path,
+                'offset': start * audio.strides[0],
+                'shape': audio.shape,
+                'dtype': audio.dtype.str
+            }
+        shm, descriptor = share_array(audio)
+        self.shared.append(shm)
+        return descriptor
+
+    def cancel(self):
+        """Pide al proceso que se detenga; si no responde, se termina."""
+        if self.cancel_time is None:
+            self.cancel_time = time.monotonic()
+            self.cancel_event.set()
+
+    def poll(self):
+        """Recoge los eventos pendientes sin bloquear.
+
+        Devuelve una lista de tuplas ('progress', valor), ('done',),
+        ('cancelled',) o ('error', mensaje); los mensajes de log y el perfil
+        de referencia se atienden aquí mismo.
+        """
+        alive = self.process is not None and self.process.is_alive()
+        events = []
+        if self.cached and not self.finished:
+            events.append(('done',))
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+
+            kind = event[0]
+            if self.launch_time is not None and self.timer is not None:
+                # Arranque del proceso e importación de módulos hasta su primer evento
+                self.timer.add_stages([{
+                    'name': 'worker_startup',
+                    'wall': time.perf_counter() - self.launch_time,
+                    'cpu': 0.0,
+                    'peak_mb': 0.0,
+                    'calls': 1
+                }])
+                self.launch_time = None
+            if kind == 'log':
+                self.logger.log(event[1], event[2])
+            elif kind == 'shared':
+                self.result_names.append(event[1])
+            elif kind == 'profile':
+                if event[1] == self.processor.reference_hash:
+                    self.processor.reference_profile = event[2]
+            elif kind == 'done':
+                events.append(self._receive_result(event[1]))
+            else:
+                events.append(event)
+
+        if not self.finished and not any(event[0] in ('done', 'cancelled', 'error') for event in events):
+            if not alive:
+                if self.cancel_time is not None:
+                    events.append(('cancelled',))
+                else:
+                    events.append(('error', "El proceso de masterización terminó inesperadamente"))
+            elif self.cancel_time is not None and time.monotonic() - self.cancel_time > CANCEL_GRACE:
+                self.process.terminate()
+                events.append(('cancelled',))
+
+        for event in events:
+            if event[0] in ('done', 'cancelled', 'error') and not self.finished:
+                self.finished = True
+                self._finish_timing(event[0] == 'done')
+
+        return events
+
+    def _finish_timing(self, success):
+        """Cierra el registro de tiempos del trabajo, con las etapas del proceso."""
+        if self.timer is None:
+            return
+        record = self.timer.stop(success)
+        record['cpu'] = round(record['cpu'] + self.child_cpu, 4)
+        record['worker_peak_rss_mb'] = self.child_peak_rss_mb
+        self.processor.finish_timing(record)
+        self.timer = None
+
+    def _receive_result(self, summary):
+        """Copia el resultado compartido al procesador."""
+        if self.timer is not None:
+            self.timer.add_stages(summary['stages'])
+            self.child_cpu = summary['cpu']
+            self.child_peak_rss_mb = summary['peak_rss_mb']
+        try:
+            backing_path = summary['result'].get('path')
+            shm, result = attach_array(summary['result'], mode='r+')
+            try:
+                with stage(self.timer, 'receive'):
+                    self.processor.adopt_result(
+                        result,
+                        summary['sample_rate'],
+                        summary['stats'],
+                        summary['loudness'],
+                        summary['overview'],
+                        backing_path
+                    )
+                    if self.region is not None:
+                        self.processor.mark_preview(*self.region)
+                if backing_path is not None:
+                    self.result_path = None
+            finally:
+                del result
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+                    self.result_names.remove(summary['result']['name'])
+        except Exception as e:
+            self.logger.error(f"Error al recibir el resultado: {str(e)}")
+            return ('error', str(e))
+        finally:
+            self.release_event.set()
+        return ('done',)
+
+    def close(self):
+        """Espera o termina el proceso y libera la memoria compartida."""
+        if self.process is not None:
+            self.release_event.set()
+            self.process.join(timeout=CANCEL_GRACE)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+            self.process = None
+
+        for shm in self.shared:
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self.shared = []
+
+        # Trabajo interrumpido antes de terminar
+        self._finish_timing(False)
+
+        # Resultados de un proceso terminado antes de entregarlos
+        for name in self.result_names:
+            _unlink_shared(name)
+        self.result_names = []
+        if self.result_path is not None:
+            try:
+                os.remove(self.result_path)
+            except OSError:
+                pass
+            self.result_path = None
+        self.events.close()